@@ -0,0 +1,57 @@
+# Copyright (c) 2020 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Load the hooks of this configuration outside of an engine, for the benchmarks.
+"""
+
+import os
+import sys
+
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOOKS_ROOT = os.path.join(CONFIG_ROOT, "hooks")
+
+
+class BenchmarkParent(object):
+    """
+    Stands for the bundle a hook is loaded by. Only the ``{config}`` hooks
+    loaded with :meth:`create_hook_instance` are supported.
+    """
+
+    def __init__(self, core_path=None):
+        self._core_path = core_path
+
+    def create_hook_instance(self, hook_expression, base_class=None):
+        return load_hook(
+            hook_expression.replace("{config}", HOOKS_ROOT), self._core_path, self
+        )
+
+
+def load_hook(hook_path, core_path=None, parent=None):
+    """
+    Create an instance of a hook with the Toolkit core hook loader.
+
+    :param str hook_path: Path to the hook file, relative to the hooks folder or absolute.
+    :param str core_path: Optional path to the tk-core python folder.
+    :param parent: Optional parent of the hook, a :class:`BenchmarkParent` by default.
+    :returns: The hook instance.
+    """
+    if core_path and core_path not in sys.path:
+        sys.path.insert(0, core_path)
+    try:
+        from tank import hook
+    except ImportError:
+        raise SystemExit(
+            "Toolkit core can't be imported, use --core to give the path to the "
+            "tk-core python folder."
+        )
+    if parent is None:
+        parent = BenchmarkParent(core_path)
+    return hook.create_hook_instance([os.path.join(HOOKS_ROOT, hook_path)], parent)
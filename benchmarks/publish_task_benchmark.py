@@ -0,0 +1,162 @@
+# Copyright (c) 2020 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Benchmark of the Task UUID setting added to each publish task for background publishing.
+
+The tk-multi-publish2 post phase hook used to add the setting by converting each task
+to a dictionary and rebuilding a task from it. It now builds the setting once and copies
+it with :meth:`PostPhase._attach_task_setting`. Both are timed on tasks standing for the
+publish2 tasks, with the same to_dict/from_dict behavior.
+
+Usage::
+
+    python benchmarks/publish_task_benchmark.py --core /path/to/tk-core/python
+    python benchmarks/publish_task_benchmark.py --tasks 5000 --settings 50
+
+The ``--core`` argument is only needed if Toolkit core can't already be imported.
+"""
+
+import argparse
+import copy
+import time
+import uuid
+
+from hook_loader import load_hook
+
+_timer = getattr(time, "perf_counter", time.time)
+
+POST_PHASE_HOOK = "tk-multi-publish2/post_phase.py"
+
+
+class Setting(object):
+    """
+    Stands for a publish2 PublishSetting.
+    """
+
+    def __init__(self, name, type, default_value, description, value):
+        self.name = name
+        self.type = type
+        self.default_value = default_value
+        self.description = description
+        self.value = value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "type": self.type,
+            "default_value": self.default_value,
+            "description": self.description,
+            "value": copy.deepcopy(self.value),
+        }
+
+
+class Task(object):
+    """
+    Stands for a publish2 PublishTask: the settings are deep copied to and from
+    dictionaries.
+    """
+
+    def __init__(self, settings_count):
+        self.name = "Publish to Shotgun"
+        self.active = True
+        self.settings = {}
+        for index in range(settings_count):
+            name = "Setting %d" % index
+            self.settings[name] = Setting(
+                name, "list", [], "Benchmark setting", ["value %d" % i for i in range(10)]
+            )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "active": self.active,
+            "settings": dict(
+                (name, setting.to_dict()) for name, setting in self.settings.items()
+            ),
+        }
+
+    @classmethod
+    def from_dict(cls, task_dict, item):
+        task = cls(0)
+        task.name = task_dict["name"]
+        task.active = task_dict["active"]
+        for name, setting_dict in task_dict["settings"].items():
+            setting_dict = copy.deepcopy(setting_dict)
+            task.settings[name] = Setting(**setting_dict)
+        return task
+
+
+def attach_with_round_trip(task, name, value, description):
+    """
+    The way the setting was added before: rebuild the task for each task.
+    """
+    task_dict = task.to_dict()
+    task_dict["settings"][name] = {
+        "name": name,
+        "type": "str",
+        "default_value": None,
+        "description": description,
+        "value": value,
+    }
+    task.settings[name] = task.from_dict(task_dict, None).settings[name]
+
+
+def time_attach(attach, tasks_count, settings_count):
+    """
+    :returns: The duration in milliseconds of adding the setting to new tasks.
+    """
+    tasks = [Task(settings_count) for _ in range(tasks_count)]
+    start = _timer()
+    for task in tasks:
+        attach(task, "Task UUID", str(uuid.uuid4()), "UUID of the current task")
+    duration = (_timer() - start) * 1000.0
+    values = set(task.settings["Task UUID"].value for task in tasks)
+    if len(values) != tasks_count:
+        raise RuntimeError("The Task UUID values are not unique.")
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--core", help="Path to the tk-core python folder.")
+    parser.add_argument("--tasks", type=int, default=1000, help="Number of tasks.")
+    parser.add_argument(
+        "--settings", type=int, default=30, help="Number of settings of each task."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs timed, the fastest is reported."
+    )
+    args = parser.parse_args()
+
+    hook = load_hook(POST_PHASE_HOOK, args.core)
+    hook_class = type(hook)
+
+    round_trip = min(
+        time_attach(attach_with_round_trip, args.tasks, args.settings)
+        for _ in range(args.repeat)
+    )
+    # a new hook instance for each run, the setting is built once per instance
+    copied = min(
+        time_attach(
+            hook_class(hook.parent)._attach_task_setting, args.tasks, args.settings
+        )
+        for _ in range(args.repeat)
+    )
+
+    print(
+        "Task UUID setting added to %d tasks of %d settings:" % (args.tasks, args.settings)
+    )
+    print("  %-30s %10.1f ms" % ("task round trip", round_trip))
+    print("  %-30s %10.1f ms" % ("_attach_task_setting", copied))
+
+
+if __name__ == "__main__":
+    main()
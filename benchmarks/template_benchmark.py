@@ -0,0 +1,344 @@
+# Copyright (c) 2020 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Standalone benchmark of the templates defined in core/templates.yml and its includes.
+
+The templates are built with the Toolkit core template classes, without a site or a
+pipeline configuration, and a synthetic path is generated for each of them. The script
+then times apply_fields, get_fields, validate and the path to template lookup done by
+``sgtk.template_from_path`` for each template, and reports the slowest templates, the
+paths matching several templates and the cost of the keys using filter_by, choices or
+a sequence type.
+
+Usage::
+
+    python benchmarks/template_benchmark.py --core /path/to/tk-core/python
+    python benchmarks/template_benchmark.py --core /path/to/tk-core/python --json results.json
+
+The ``--core`` argument is only needed if Toolkit core can't already be imported.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import time
+
+try:
+    from tank_vendor import yaml
+except ImportError:
+    import yaml
+
+_timer = getattr(time, "perf_counter", time.time)
+
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES_FILE = os.path.join(CONFIG_ROOT, "core", "templates.yml")
+
+# Realistic values for the entity keys, other keys get generated values.
+SAMPLE_VALUES = {
+    "Sequence": "SQ010",
+    "Shot": "SH0100",
+    "Step": "comp",
+    "Asset": "chair",
+    "sg_asset_type": "Prop",
+    "name": "main",
+}
+# Values tried in order for keys without a sample value, a default or choices.
+FALLBACK_VALUES = ["abc01", "abc", "12", "a"]
+
+
+def load_templates_data(path):
+    """
+    Load a templates file, merging the keys, paths and strings of the files it
+    includes. Definitions of the including file override the included ones.
+
+    :param str path: Path to the templates file.
+    :returns: A dictionary with keys, paths and strings dictionaries.
+    """
+    with open(path, "r") as fp:
+        data = yaml.safe_load(fp) or {}
+
+    merged = {"keys": {}, "paths": {}, "strings": {}}
+    includes = data.get("include") or data.get("includes") or []
+    if not isinstance(includes, list):
+        includes = [includes]
+    for include in includes:
+        include_path = os.path.join(os.path.dirname(path), os.path.expandvars(include))
+        included = load_templates_data(include_path)
+        for section in merged:
+            merged[section].update(included[section])
+    for section in merged:
+        merged[section].update(data.get(section) or {})
+    return merged
+
+
+def resolve_definitions(section, *alias_sections):
+    """
+    Get the definition of each template of a section, with their ``@alias``
+    replaced by the aliased definition.
+
+    :param dict section: The paths or strings section.
+    :param alias_sections: The sections where aliases are looked up.
+    :returns: A dictionary where keys are template names and values definitions.
+    """
+    aliases = {}
+    for alias_section in alias_sections:
+        aliases.update(alias_section)
+
+    def resolve(definition, seen):
+        match = re.match(r"^@(\w+)(.*)$", definition)
+        if not match:
+            return definition
+        alias = match.group(1)
+        if alias in seen or alias not in aliases:
+            raise ValueError("Can't resolve the template alias @%s" % alias)
+        return resolve(get_definition(aliases[alias]), seen | set([alias])) + match.group(2)
+
+    def get_definition(value):
+        return value["definition"] if isinstance(value, dict) else value
+
+    return dict(
+        (name, resolve(get_definition(value), set())) for name, value in section.items()
+    )
+
+
+def import_toolkit(core_path=None):
+    """
+    Import the Toolkit core template classes.
+
+    :param str core_path: Optional path to the tk-core python folder.
+    :returns: A (TemplatePath, TemplateString, make_keys) tuple.
+    """
+    if core_path:
+        sys.path.insert(0, core_path)
+    try:
+        from tank.template import TemplatePath, TemplateString
+        from tank.templatekey import make_keys
+    except ImportError:
+        raise SystemExit(
+            "Toolkit core can't be imported, use --core to give the path to the "
+            "tk-core python folder."
+        )
+    return TemplatePath, TemplateString, make_keys
+
+
+def build_templates(data, root_path, core_path=None):
+    """
+    Build the Toolkit templates from the templates data.
+
+    :param dict data: The templates data returned by :func:`load_templates_data`.
+    :param str root_path: The project root used by all the path templates.
+    :param str core_path: Optional path to the tk-core python folder.
+    :returns: A (path templates, string templates) tuple of dictionaries, and a
+        dictionary of the templates which could not be built and their error.
+    """
+    TemplatePath, TemplateString, make_keys = import_toolkit(core_path)
+    keys = make_keys(data["keys"])
+
+    errors = {}
+    path_templates = {}
+    for name, definition in resolve_definitions(data["paths"], data["paths"]).items():
+        try:
+            path_templates[name] = TemplatePath(definition, keys, root_path, name=name)
+        except Exception as e:
+            errors[name] = str(e)
+
+    string_templates = {}
+    for name, definition in resolve_definitions(
+        data["strings"], data["strings"], data["paths"]
+    ).items():
+        try:
+            string_templates[name] = TemplateString(definition, keys, name=name)
+        except Exception as e:
+            errors[name] = str(e)
+    return path_templates, string_templates, errors
+
+
+def generate_value(key):
+    """
+    Generate a valid value for a template key.
+
+    :param key: A Toolkit TemplateKey instance.
+    :returns: A value for the key.
+    """
+    key_type = type(key).__name__
+    if key_type == "TimestampKey":
+        return datetime.datetime(2024, 1, 2, 3, 4, 5)
+    if key_type == "SequenceKey":
+        return 1001
+
+    candidates = []
+    if key.name in SAMPLE_VALUES:
+        candidates.append(SAMPLE_VALUES[key.name])
+    if getattr(key, "default", None) is not None:
+        candidates.append(key.default)
+    candidates.extend(getattr(key, "choices", None) or [])
+    if key_type == "IntegerKey":
+        candidates.extend([12, 1])
+    else:
+        candidates.extend(FALLBACK_VALUES)
+
+    for value in candidates:
+        if key.validate(value):
+            return value
+    raise ValueError("No valid value found for the key %s" % key.name)
+
+
+def time_call(func, iterations):
+    """
+    :returns: The mean duration of a call in microseconds.
+    """
+    start = _timer()
+    for _ in range(iterations):
+        func()
+    return (_timer() - start) * 1000000.0 / iterations
+
+
+def benchmark(path_templates, string_templates, iterations):
+    """
+    Time the main operations of each template.
+
+    :param dict path_templates: The path templates by name.
+    :param dict string_templates: The string templates by name.
+    :param int iterations: Number of calls timed for each operation.
+    :returns: A list of result dictionaries, one for each template.
+    """
+    all_path_templates = list(path_templates.values())
+    results = []
+    for name, template in sorted(list(path_templates.items()) + list(string_templates.items())):
+        result = {"name": name, "definition": template.definition}
+        results.append(result)
+        try:
+            fields = dict(
+                (key.name, generate_value(key)) for key in template.keys.values()
+            )
+            path = template.apply_fields(fields)
+        except Exception as e:
+            result["error"] = str(e)
+            continue
+
+        result["path"] = path
+        result["keys"] = sorted(template.keys)
+        result["apply_fields"] = time_call(lambda: template.apply_fields(fields), iterations)
+        result["get_fields"] = time_call(lambda: template.get_fields(path), iterations)
+        result["validate"] = time_call(lambda: template.validate(path), iterations)
+        if name in path_templates:
+            # this is what sgtk.template_from_path does for each path
+            def lookup():
+                return [t for t in all_path_templates if t.validate(path)]
+
+            result["matches"] = sorted(t.name for t in lookup())
+            result["lookup"] = time_call(lookup, max(1, iterations // 10))
+        result["total"] = sum(
+            result.get(op, 0.0) for op in ("apply_fields", "get_fields", "validate", "lookup")
+        )
+    return results
+
+
+def report(results, keys_data, top):
+    """
+    Print the slowest templates, the ambiguous paths and the keys cost.
+
+    :param list results: The results returned by :func:`benchmark`.
+    :param dict keys_data: The keys section of the templates data.
+    :param int top: Number of slowest templates reported.
+    """
+    timed = [result for result in results if "total" in result]
+    failed = [result for result in results if "error" in result]
+    print("%d templates timed, %d skipped." % (len(timed), len(failed)))
+    for result in failed:
+        print("  skipped %s: %s" % (result["name"], result["error"]))
+
+    print("\nSlowest templates (microseconds per call):")
+    print(
+        "  %-40s %12s %12s %12s %12s"
+        % ("template", "apply_fields", "get_fields", "validate", "lookup")
+    )
+    for result in sorted(timed, key=lambda r: r["total"], reverse=True)[:top]:
+        print(
+            "  %-40s %12.1f %12.1f %12.1f %12s"
+            % (
+                result["name"],
+                result["apply_fields"],
+                result["get_fields"],
+                result["validate"],
+                "%.1f" % result["lookup"] if "lookup" in result else "-",
+            )
+        )
+
+    ambiguous = dict(
+        (result["path"], result["matches"])
+        for result in timed
+        if len(result.get("matches", [])) > 1
+    )
+    print("\n%d paths matching several templates:" % len(ambiguous))
+    for path, matches in sorted(ambiguous.items()):
+        print("  %s: %s" % (path, ", ".join(matches)))
+    unmatched = [
+        result for result in timed if "matches" in result and result["name"] not in result["matches"]
+    ]
+    for result in unmatched:
+        print("  %s doesn't match its own template %s" % (result["path"], result["name"]))
+
+    print("\nKeys using filter_by, choices or a sequence type (mean get_fields):")
+    for key_name, key_data in sorted(keys_data.items()):
+        if not (
+            "filter_by" in key_data
+            or "choices" in key_data
+            or key_data.get("type") == "sequence"
+        ):
+            continue
+        durations = [r["get_fields"] for r in timed if key_name in r["keys"]]
+        if durations:
+            print(
+                "  %-30s %4d templates %10.1f"
+                % (key_name, len(durations), sum(durations) / len(durations))
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--core", help="Path to the tk-core python folder.")
+    parser.add_argument(
+        "--templates", default=TEMPLATES_FILE, help="Path to the templates file."
+    )
+    parser.add_argument(
+        "--root", default="/mnt/projects/benchmark", help="Project root of the paths."
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=200, help="Calls timed for each operation."
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="Number of slowest templates reported."
+    )
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    data = load_templates_data(args.templates)
+    path_templates, string_templates, errors = build_templates(
+        data, args.root, args.core
+    )
+    for name, error in sorted(errors.items()):
+        print("Template %s can't be built: %s" % (name, error))
+
+    results = benchmark(path_templates, string_templates, args.iterations)
+    report(results, data["keys"], args.top)
+
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        print("\nResults written to %s" % args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Copyright (c) 2020 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Benchmark of the template lookup done by the standalone publisher from a file path.
+
+The templates of core/templates.yml are built as in template_benchmark.py and a path is
+generated for each path template. Each path is then looked up with the folder trie of
+the standalone publisher hook, which only validates the candidate templates whose
+leading folders match, and by validating every template like ``sgtk.template_from_path``.
+The script checks the candidates contain every matching template and reports the number
+of templates validated and the lookup times.
+
+Usage::
+
+    python benchmarks/template_trie_benchmark.py --core /path/to/tk-core/python
+
+The ``--core`` argument is only needed if Toolkit core can't already be imported.
+"""
+
+import argparse
+
+from hook_loader import BenchmarkParent, load_hook
+from template_benchmark import (
+    TEMPLATES_FILE,
+    build_templates,
+    generate_value,
+    load_templates_data,
+    time_call,
+)
+
+STANDALONE_PUBLISH_HOOK = "tk-multi-publish2/standalone_publish_file_to_location.py"
+
+
+class BenchmarkTk(object):
+    """
+    Stands for the Sgtk instance of the hooks, only giving access to the templates.
+    """
+
+    def __init__(self, templates):
+        self.templates = templates
+
+    def template_from_path(self, path):
+        matches = [t for t in self.templates.values() if t.validate(path)]
+        return matches[0] if matches else None
+
+
+def generate_paths(path_templates):
+    """
+    Generate a path for each path template.
+
+    :param dict path_templates: The path templates by name.
+    :returns: A dictionary where keys are template names and values paths.
+    """
+    paths = {}
+    for name, template in path_templates.items():
+        try:
+            fields = dict(
+                (key.name, generate_value(key)) for key in template.keys.values()
+            )
+            paths[name] = template.apply_fields(fields)
+        except Exception as e:
+            print("No path generated for %s: %s" % (name, e))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--core", help="Path to the tk-core python folder.")
+    parser.add_argument(
+        "--templates", default=TEMPLATES_FILE, help="Path to the templates file."
+    )
+    parser.add_argument(
+        "--root", default="/mnt/projects/benchmark", help="Project root of the paths."
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=100, help="Lookups timed for each path."
+    )
+    args = parser.parse_args()
+
+    data = load_templates_data(args.templates)
+    path_templates, string_templates, errors = build_templates(
+        data, args.root, args.core
+    )
+    for name, error in sorted(errors.items()):
+        print("Template %s can't be built: %s" % (name, error))
+    templates = dict(path_templates)
+    templates.update(string_templates)
+
+    parent = BenchmarkParent(args.core)
+    parent.sgtk = parent.tank = BenchmarkTk(templates)
+    hook = load_hook(STANDALONE_PUBLISH_HOOK, args.core, parent)
+
+    paths = generate_paths(path_templates)
+    candidates_count = 0
+    missed = []
+    full_time = 0.0
+    trie_time = 0.0
+    all_templates = list(templates.values())
+    for name, path in sorted(paths.items()):
+        matches = [t for t in all_templates if t.validate(path)]
+        candidates = hook._get_template_candidates(path)
+        candidates_count += len(candidates)
+        missed.extend(
+            (path, t.name) for t in matches if not any(t is c for c in candidates)
+        )
+        full_time += time_call(
+            lambda: [t for t in all_templates if t.validate(path)], args.iterations
+        )
+        trie_time += time_call(lambda: hook._template_from_path(path), args.iterations)
+
+    count = max(1, len(paths))
+    print(
+        "%d paths looked up among %d templates (%d path templates)."
+        % (len(paths), len(templates), len(path_templates))
+    )
+    print(
+        "  templates validated per path: %.1f with the trie, %d without"
+        % (float(candidates_count) / count, len(templates))
+    )
+    print(
+        "  templates without indexed folders, validated for every path: %d"
+        % len(hook._get_template_trie()[1])
+    )
+    print(
+        "  mean lookup time: %.1f us with the trie, %.1f us without"
+        % (trie_time / count, full_time / count)
+    )
+    print("  matching templates missing from the candidates: %d" % len(missed))
+    for path, name in missed:
+        print("    %s: %s" % (path, name))
+
+
+if __name__ == "__main__":
+    main()
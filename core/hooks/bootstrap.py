@@ -11,13 +11,29 @@ applications, frameworks and engines can be downloaded through the hook.
 
 import os
 import zipfile
+import base64
+import contextlib
+import hashlib
+import io
 import json
 import platform
 import re
+import socket
+import tempfile
+import threading
+import time
 
 from sgtk import get_hook_baseclass
 
 
+# Matches Github repository git paths, e.g. git@github.com:org/repo.git or
+# https://github.com/org/repo.git, and captures the org/repo name.
+_GITHUB_PATH_RE = re.compile(
+    r"^(?:git@github\.com:|(?:https?|ssh|git)://(?:[^@/]+@)?github\.com/)"
+    r"([^/]+/[^/]+?)(?:\.git)?/?$",
+    re.IGNORECASE
+)
+
 _SIX_IMPORT_WARNING = (
     "Unable to import six.moves from tk-core, this can happen "
     "if an old version of tk-core < 0.19.1 is used in a site "
@@ -25,6 +41,329 @@ _SIX_IMPORT_WARNING = (
 )
 
 
+class _ReleaseMetadataCache(object):
+    """
+    On disk cache for Github release metadata, keyed by repository and tag.
+
+    Each entry is stored in its own json file with the release dictionary
+    returned by the Github REST api, the ``ETag`` sent with it and the time
+    at which it was last validated with Github.
+    """
+
+    def __init__(self, location):
+        """
+        :param str location: Full path to the folder where entries are stored.
+                             The folder is created if it does not exist.
+        """
+        self._location = location
+
+    def _entry_path(self, repo, tag):
+        """
+        Return the path to the file for the given repository and tag.
+
+        :param str repo: A Github repository name, e.g. ``org/repo``.
+        :param str tag: A release tag.
+        :returns: A full path.
+        """
+        key = hashlib.sha1(("%s@%s" % (repo, tag)).encode("utf-8")).hexdigest()
+        return os.path.join(self._location, "%s.json" % key)
+
+    def load(self, repo, tag):
+        """
+        Return the cached entry for the given repository and tag.
+
+        :param str repo: A Github repository name, e.g. ``org/repo``.
+        :param str tag: A release tag.
+        :returns: An entry dictionary or ``None``.
+        """
+        path = self._entry_path(repo, tag)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get("repo") != repo or entry.get("tag") != tag:
+            return None
+        return entry
+
+    def save(self, repo, tag, entry):
+        """
+        Store the given entry for the given repository and tag.
+
+        The entry is written to a temporary file which is then renamed, so
+        concurrent readers never see a partially written entry.
+
+        :param str repo: A Github repository name, e.g. ``org/repo``.
+        :param str tag: A release tag.
+        :param entry: An entry dictionary.
+        """
+        entry = dict(entry, repo=repo, tag=tag)
+        path = self._entry_path(repo, tag)
+        if not os.path.isdir(self._location):
+            try:
+                os.makedirs(self._location)
+            except OSError:
+                # Could have been created by another process in the meantime.
+                if not os.path.isdir(self._location):
+                    raise
+        tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        if os.path.exists(path) and platform.system() == "Windows":
+            # os.rename does not overwrite existing files on Windows
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+class _HttpSession(object):
+    """
+    Minimal thread safe HTTP client which keeps connections alive between
+    requests.
+
+    Requests are built with urllib ``Request`` objects and errors are reported
+    with urllib exceptions, so the session can be used in place of ``urlopen``
+    without installing a process wide urllib opener.
+    """
+
+    # Number of redirections followed before giving up.
+    max_redirects = 5
+
+    def __init__(self, proxy_handler=None, timeout=60):
+        """
+        :param proxy_handler: Optional urllib ``ProxyHandler`` with the proxy
+                              settings to use. Proxy settings from the
+                              environment are used if not set.
+        :param float timeout: Timeout, in seconds, for blocking operations.
+        """
+        try:
+            from tank_vendor.six.moves.urllib import request as url2
+            from tank_vendor.six.moves.urllib import error as error_url2
+            from tank_vendor.six.moves.urllib import parse as urlparse
+            from tank_vendor.six.moves import http_client
+        except ImportError:
+            # Fallback on using urllib2, a warning is logged by the hook.
+            import urllib2 as url2
+            import urllib2 as error_url2
+            import urlparse
+            import httplib as http_client
+        self._url2 = url2
+        self._error_url2 = error_url2
+        self._urlparse = urlparse
+        self._http_client = http_client
+        if proxy_handler is not None:
+            self._proxies = dict(getattr(proxy_handler, "proxies", None) or {})
+            self._env_proxies = False
+        else:
+            self._proxies = url2.getproxies()
+            self._env_proxies = True
+        self._timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def open(self, request):
+        """
+        Send the given GET request and return the response.
+
+        Redirections are followed, unredirected headers are only sent with the
+        initial request.
+
+        :param request: A urllib ``Request``.
+        :returns: A :class:`_HttpSessionResponse` instance.
+        :raises HTTPError: For unsuccessful HTTP status codes.
+        :raises URLError: If the server can't be reached.
+        """
+        url = request.get_full_url()
+        headers = dict(request.header_items())
+        for _ in range(self.max_redirects + 1):
+            key, response = self._send(url, headers)
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader("Location")
+                response.read()
+                self._release(key, response)
+                url = self._urlparse.urljoin(url, location)
+                headers = dict(request.headers)
+                continue
+            if not 200 <= response.status < 300:
+                body = response.read()
+                self._release(key, response)
+                raise self._error_url2.HTTPError(
+                    url, response.status, response.reason, response.msg, io.BytesIO(body)
+                )
+            return _HttpSessionResponse(self, key, response)
+        raise self._error_url2.URLError("Too many redirections for %s" % request.get_full_url())
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _send(self, url, headers):
+        """
+        Send a GET request for the given url with a pooled connection.
+
+        :param str url: The url to retrieve.
+        :param headers: A dictionary of headers to send.
+        :returns: A connection key, ``HTTPResponse`` tuple.
+        """
+        parts = self._urlparse.urlsplit(url)
+        proxy = self._get_proxy(parts.scheme, parts.hostname)
+        key = (parts.scheme, parts.netloc, proxy)
+        selector = parts.path or "/"
+        if parts.query:
+            selector = "%s?%s" % (selector, parts.query)
+        headers = dict(headers)
+        headers.setdefault("Host", parts.netloc)
+        if proxy and parts.scheme == "http":
+            # Plain http requests are sent to the proxy with the full url.
+            selector = url
+            auth = self._get_proxy_authorization(proxy)
+            if auth:
+                headers["Proxy-Authorization"] = auth
+        while True:
+            connection, reused = self._acquire(key, parts, proxy)
+            try:
+                connection.request("GET", selector, headers=headers)
+                response = connection.getresponse()
+                response._session_connection = connection
+                return key, response
+            except (self._http_client.HTTPException, socket.error) as e:
+                connection.close()
+                if reused:
+                    # The server likely closed the idle connection, retry with
+                    # a new one.
+                    continue
+                raise self._error_url2.URLError(e)
+
+    def _acquire(self, key, parts, proxy):
+        """
+        Return an idle connection for the given key or a new one.
+
+        :returns: A connection, ``bool`` tuple, the boolean being ``True`` if the
+                  connection was already used for a previous request.
+        """
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop(), True
+        port = parts.port
+        if proxy:
+            proxy_parts = self._urlparse.urlsplit(
+                proxy if "://" in proxy else "http://%s" % proxy
+            )
+            host, port = proxy_parts.hostname, proxy_parts.port or 80
+        else:
+            host = parts.hostname
+        if parts.scheme == "https":
+            connection = self._http_client.HTTPSConnection(
+                host, port, timeout=self._timeout
+            )
+            if proxy:
+                auth = self._get_proxy_authorization(proxy)
+                connection.set_tunnel(
+                    parts.hostname,
+                    parts.port or 443,
+                    headers={"Proxy-Authorization": auth} if auth else None,
+                )
+        else:
+            connection = self._http_client.HTTPConnection(
+                host, port, timeout=self._timeout
+            )
+        return connection, False
+
+    def _release(self, key, response):
+        """
+        Give back the connection used for the given fully read response to the
+        pool, or close it if it can't be reused.
+        """
+        connection = response._session_connection
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def _get_proxy(self, scheme, host):
+        """
+        Return the proxy to use for the given scheme and host, if any.
+        """
+        if self._env_proxies and host and self._url2.proxy_bypass(host):
+            return None
+        return self._proxies.get(scheme)
+
+    def _get_proxy_authorization(self, proxy):
+        """
+        Return a ``Proxy-Authorization`` header value for the given proxy url,
+        or ``None`` if it does not have credentials.
+        """
+        proxy_parts = self._urlparse.urlsplit(
+            proxy if "://" in proxy else "http://%s" % proxy
+        )
+        if not proxy_parts.username:
+            return None
+        credentials = "%s:%s" % (
+            self._urlparse.unquote(proxy_parts.username),
+            self._urlparse.unquote(proxy_parts.password or ""),
+        )
+        return "Basic %s" % base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+
+
+class _HttpSessionResponse(object):
+    """
+    Response returned by :meth:`_HttpSession.open`, with the subset of urllib
+    responses interface used by the bootstrap hook.
+
+    The connection is given back to the session once the response was fully
+    read or closed.
+    """
+
+    def __init__(self, session, key, response):
+        self._session = session
+        self._key = key
+        self._response = response
+        self._released = False
+        self.headers = response.msg
+
+    def getcode(self):
+        """
+        :returns: The HTTP status code.
+        """
+        return self._response.status
+
+    def read(self, amt=None):
+        """
+        Read and return up to ``amt`` bytes, or everything if not set.
+        """
+        data = self._response.read(amt) if amt is not None else self._response.read()
+        if not data or self._response.isclosed():
+            self._release()
+        return data
+
+    def close(self):
+        """
+        Close the response, and the connection if it was not fully read.
+        """
+        if not self._release():
+            self._response.close()
+
+    def _release(self):
+        """
+        Give back the connection to the session.
+
+        :returns: ``True`` if the connection was already released.
+        """
+        if self._released:
+            return True
+        self._released = True
+        self._session._release(self._key, self._response)
+        return False
+
+
 class Bootstrap(get_hook_baseclass()):
     """
     Override the bootstrap core hook to cache some bundles ourselves.
@@ -36,6 +375,53 @@ class Bootstrap(get_hook_baseclass()):
         ("ue4plugins/tk-framework-unrealqt", ""),
         ("GPLgithub/tk-framework-unrealqt", ""),
     ]
+    # Optional path to a yaml file listing additional Github repositories to
+    # download releases from, after the ones above, e.g.:
+    #   - repository: org/repo
+    #     token: $ORG_REPO_GITHUB_TOKEN
+    #   - org/public-repo
+    # Environment variables in paths and tokens are expanded.
+    _download_release_from_github_file = os.environ.get("TK_BOOTSTRAP_GITHUB_RELEASES")
+    # Size of the chunks read from the network and written to disk when
+    # downloading release assets.
+    _download_chunk_size = 1024 * 1024
+    # Number of times an interrupted asset download is resumed before giving up.
+    _download_max_resumes = 5
+    # Minimum delay, in seconds, between two download progress messages.
+    _download_progress_interval = 5.0
+    # Maximum number of release assets fetched at the same time. Set it to 1
+    # to download and extract assets one after the other.
+    _download_max_workers = 4
+    # Assets are extracted in the same destination folder, serialize extractions
+    # to avoid concurrent creation of the same sub folders.
+    _extract_lock = threading.Lock()
+    # Folder where Github release metadata is cached, the bootstrap folder in the
+    # Toolkit global cache location is used if not set.
+    _release_cache_location = None
+    # Number of seconds during which cached release metadata is used without
+    # checking with Github if the release changed.
+    _release_cache_ttl = 60 * 60
+    # Whether release tags can be considered immutable, in which case cached
+    # release metadata is always used without contacting Github. Releases flagged
+    # as immutable by Github are always treated this way.
+    _release_tags_immutable = False
+    # Site mirror checked for release assets before Github: a folder or a http(s)
+    # url with the same assets as Github releases, laid out as
+    # <organization>/<repository>/<version>/<version>-py<ver>-<platform>.zip
+    _bundle_mirror = os.environ.get("TK_BUNDLE_MIRROR")
+    # Archives with at least this number of files are extracted with a pool of
+    # _download_max_workers threads.
+    _extract_parallel_min_files = 64
+    # Release assets which can publish SHA-256 checksums for the other assets,
+    # either "<asset name>.sha256" or one of these files.
+    _checksum_asset_names = ["SHA256SUMS", "sha256sums.txt", "checksums.txt"]
+    # Timeout, in seconds, for blocking network operations.
+    _http_timeout = 60
+    # Optional path to a file where a json timing report is appended, as a
+    # single line, for every bundle cached by this hook. The report is always
+    # logged.
+    _timing_report_path = os.environ.get("TK_BOOTSTRAP_TIMING_REPORT")
+    _timings_lock = threading.Lock()
 
     def can_cache_bundle(self, descriptor):
         """
@@ -53,8 +439,14 @@ class Bootstrap(get_hook_baseclass()):
         :rtype: bool
         :raises RuntimeError: If six.moves is not available.
         """
-        descd = descriptor.get_dict()
-        return bool(self._should_download_release(descd))
+        with self._timed("can_cache_bundle"):
+            descd = descriptor.get_dict()
+            if self._should_download_release(descd):
+                return True
+            # Bundles which are not released on Github can still be cached if they
+            # are available from the site mirror.
+            name = self._get_descriptor_repo_name(descd)
+            return bool(name and self._list_mirror_assets(name, descriptor.version))
 
     def populate_bundle_cache_entry(self, destination, descriptor, **kwargs):
         """
@@ -73,51 +465,34 @@ class Bootstrap(get_hook_baseclass()):
 
         :param descriptor: Descriptor of the bundle that needs to be cached.
         """
-        # This logic can be removed once we can assume tk-core is > v0.19.1 not
-        # just in configs but also in the bundled Shotgun.app.
-        try:
-            from tank_vendor.six.moves.urllib import request as url2
-            from tank_vendor.six.moves.urllib import error as error_url2
-        except ImportError as e:
-            self.logger.warning(_SIX_IMPORT_WARNING)
-            self.logger.debug("%s" % e, exc_info=True)
-            # Fallback on using urllib2
-            import urllib2 as url2
-            import urllib2 as error_url2
-
         descd = descriptor.get_dict()
         version = descriptor.version
         self.logger.info("Treating %s" % descd)
         specs = self._should_download_release(descd)
-        if not specs:
-            raise RuntimeError("Don't know how to download %s" % descd)
-        name = specs[0]
-        token = specs[1]
+        if specs:
+            name, token = specs
+        else:
+            name, token = self._get_descriptor_repo_name(descd), ""
+        start = time.time()
+        status = "failed"
         try:
-            if self.shotgun.config.proxy_handler:
-                # Re-use proxy settings from the Shotgun connection
-                opener = url2.build_opener(
-                    self.parent.shotgun.config.proxy_handler,
-                )
-                url2.install_opener(opener)
-
-            # Retrieve the release from the tag
-            url = "https://api.github.com/repos/%s/releases/tags/%s" % (name, version)
-            request = url2.Request(url)
-            # Add the authorization token if we have one (private repos)
-            if token:
-                request.add_header("Authorization", "token %s" % token)
-            request.add_header("Accept", "application/vnd.github.v3+json")
-            try:
-                response = url2.urlopen(request)
-            except error_url2.URLError as e:
-                if hasattr(e, "code"):
-                    if e.code == 404:
-                        self.logger.error("Release %s does not exists" % version)
-                    elif e.code == 401:
-                        self.logger.error("Not authorised to access release %s." % version)
-                raise
-            response_d = json.loads(response.read())
+            mirror_assets = self._list_mirror_assets(name, version) if name else []
+            if specs:
+                try:
+                    response_d = self._get_github_release(name, version, token)
+                except Exception as e:
+                    if not mirror_assets:
+                        raise
+                    self.logger.warning(
+                        "Unable to retrieve release %s %s from Github (%s), "
+                        "only using the site mirror" % (name, version, e)
+                    )
+                    response_d = {"assets": mirror_assets}
+            elif mirror_assets:
+                response_d = {"assets": mirror_assets}
+            else:
+                raise RuntimeError("Don't know how to download %s" % descd)
+
             # Look up for suitable assets for this platform. Assets names
             # follow this convention:
             #  <version>-py<python version>-<platform>.zip
@@ -125,30 +500,14 @@ class Bootstrap(get_hook_baseclass()):
             # the current platform and version. We're assuming that the cached
             # config for a user will never be shared between machines with
             # different os.
-            pname = {
-                "Darwin": "osx",
-                "Linux": "linux",
-                "Windows": "win"
-            }.get(platform.system())
-
-            if not pname:
-                raise ValueError("Unsupported platform %s" % platform.system())
-
-            extracted = []
-            for asset in response_d["assets"]:
-                name = asset["name"]
-                m = re.match(
-                    r"%s-py\d.\d-%s.zip" % (version, pname),
-                    name
+            assets = [
+                asset for asset in response_d["assets"] if re.match(
+                    self._get_asset_pattern(version),
+                    asset["name"]
                 )
-                if m:
-                    # Download the asset payload
-                    self._download_zip_github_asset(
-                        asset,
-                        destination,
-                        token
-                    )
-                    extracted.append(asset)
+            ]
+            self._set_expected_checksums(assets, response_d["assets"], token)
+            extracted = self._fetch_assets(assets, destination, name, version, token)
 
             if not extracted:
                 raise RuntimeError(
@@ -162,35 +521,503 @@ class Bootstrap(get_hook_baseclass()):
                     ",".join([a["name"] for a in extracted])
                 )
             )
+            status = "ok"
         except Exception as e:
             # Log the exception with the backtrace because TK obfuscates it.
             self.logger.exception(e)
             raise
+        finally:
+            self._report_timings(name or descd, version, status, time.time() - start)
+            # Connections are only reused for the requests of a bundle, don't
+            # leave idle sockets open once it is cached.
+            if getattr(self, "_http_session_instance", None) is not None:
+                self._http_session_instance.close()
 
-    def _should_download_release(self, desc):
+    @contextlib.contextmanager
+    def _timed(self, stage, **data):
         """
-        Return a repo name and a token if the given descriptor should be downloaded
-        from a github release.
+        Context manager recording how long the wrapped code took to run.
+
+        The record is yielded so extra data can be added to it, and reported
+        with the next :meth:`_report_timings` call. Failures are recorded
+        with the error message.
+
+        :param str stage: The name of the timed stage.
+        :param data: Extra data to record.
+        """
+        record = dict(data, stage=stage)
+        start = time.time()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            record["duration"] = round(time.time() - start, 4)
+            with self._timings_lock:
+                self._get_timings().append(record)
+
+    def _get_timings(self):
+        """
+        Return the timing records collected since the last report.
+
+        :returns: A list of dictionaries.
+        """
+        if getattr(self, "_timings", None) is None:
+            self._timings = []
+        return self._timings
+
+    def _report_timings(self, name, version, status, duration):
+        """
+        Log a json summary of the timings collected while caching a bundle, and
+        append it to :attr:`_timing_report_path` if set.
+
+        :param str name: The bundle name.
+        :param str version: The bundle version.
+        :param str status: ``ok`` or ``failed``.
+        :param float duration: Time spent caching the bundle, in seconds.
+        """
+        with self._timings_lock:
+            records = self._get_timings()
+            self._timings = []
+        can_cache = [r for r in records if r["stage"] == "can_cache_bundle"]
+        downloads = [r for r in records if r["stage"] == "download"]
+        for record in downloads:
+            record["bytes_per_sec"] = round(
+                record.get("bytes", 0) / max(record["duration"], 0.001)
+            )
+        report = {
+            "bundle": name,
+            "version": version,
+            "status": status,
+            "host": platform.node(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "duration": round(duration, 4),
+            "can_cache_bundle": {
+                "calls": len(can_cache),
+                "duration": round(sum([r["duration"] for r in can_cache]), 4),
+            },
+            "downloaded_bytes": sum([r.get("bytes", 0) for r in downloads]),
+            "stages": [r for r in records if r["stage"] != "can_cache_bundle"],
+        }
+        report = json.dumps(report, sort_keys=True)
+        self.logger.info("Bootstrap timings: %s" % report)
+        if self._timing_report_path:
+            try:
+                with open(os.path.expandvars(self._timing_report_path), "a") as f:
+                    f.write("%s\n" % report)
+            except (IOError, OSError) as e:
+                self.logger.warning(
+                    "Unable to write timing report to %s: %s" % (
+                        self._timing_report_path, e
+                    )
+                )
+
+    def _get_asset_pattern(self, version):
+        """
+        Return a regular expression matching release asset names suitable for
+        the current platform.
+
+        :param str version: The release version.
+        :returns: A regular expression string.
+        :raises ValueError: If the current platform is not supported.
+        """
+        pname = {
+            "Darwin": "osx",
+            "Linux": "linux",
+            "Windows": "win"
+        }.get(platform.system())
+
+        if not pname:
+            raise ValueError("Unsupported platform %s" % platform.system())
+        return r"%s-py\d.\d-%s.zip" % (version, pname)
+
+    def _get_descriptor_repo_name(self, desc):
+        """
+        Return the Github repository name for the given descriptor.
 
         :param str desc: A Toolkit descriptor.
-        :returns: A name, token tuple or ``None``.
+        :returns: An ``organization/repository`` string or ``None``.
         """
         if desc["type"] == "github_release":
             # Let's be safe...
-            if not desc.get("organization") or not desc.get("repository"):
-                return None
-            desc_path = "%s/%s" % (desc["organization"], desc["repository"])
-            for name, token in self._download_release_from_github:
-                if name == desc_path:
-                    return name, token
+            if desc.get("organization") and desc.get("repository"):
+                return "%s/%s" % (desc["organization"], desc["repository"])
         elif desc.get("path"):
             # Check the path for a git descriptor
-            desc_path = desc["path"]
-            for name, token in self._download_release_from_github:
-                if "git@github.com:%s.git" % name == desc_path:
-                    return name, token
+            m = _GITHUB_PATH_RE.match(desc["path"])
+            if m:
+                return m.group(1)
         return None
 
+    def _get_mirror_location(self, name, version, asset_name=None):
+        """
+        Return the location of a release, or of one of its assets, on the site
+        mirror.
+
+        :param str name: A Github repository name, e.g. ``org/repo``.
+        :param str version: The release version.
+        :param str asset_name: Optional asset name.
+        :returns: A path or a url, ``None`` if no site mirror is configured.
+        """
+        if not self._bundle_mirror:
+            return None
+        parts = name.split("/") + [version]
+        if asset_name:
+            parts.append(asset_name)
+        if re.match(r"https?://", self._bundle_mirror):
+            return "/".join([self._bundle_mirror.rstrip("/")] + parts)
+        return os.path.join(os.path.expandvars(self._bundle_mirror), *parts)
+
+    def _list_mirror_assets(self, name, version):
+        """
+        Return the assets for the current platform available on the site mirror
+        for the given release.
+
+        Only site mirrors stored on a file system can be listed, an empty list
+        is always returned for http mirrors.
+
+        :param str name: A Github repository name, e.g. ``org/repo``.
+        :param str version: The release version.
+        :returns: A list of asset dictionaries, with a ``name``, a ``size`` and
+                  a ``mirror_path`` key.
+        """
+        location = self._get_mirror_location(name, version)
+        if not location or re.match(r"https?://", location):
+            return []
+        try:
+            names = os.listdir(location)
+        except OSError:
+            return []
+        pattern = self._get_asset_pattern(version)
+        return [
+            {
+                "name": asset_name,
+                "size": os.path.getsize(os.path.join(location, asset_name)),
+                "mirror_path": os.path.join(location, asset_name),
+            } for asset_name in sorted(names) if re.match(pattern, asset_name)
+        ]
+
+    @property
+    def _http_session(self):
+        """
+        Return the HTTP session used for all the requests sent by this hook.
+
+        Proxy settings from the Shotgun connection are used if set.
+
+        :returns: A :class:`_HttpSession` instance.
+        """
+        if getattr(self, "_http_session_instance", None) is None:
+            self._http_session_instance = _HttpSession(
+                # Re-use proxy settings from the Shotgun connection
+                self.shotgun.config.proxy_handler,
+                timeout=self._http_timeout,
+            )
+        return self._http_session_instance
+
+    @property
+    def _release_cache(self):
+        """
+        Return the Github release metadata cache shared by all the repositories
+        this hook downloads releases from.
+
+        :returns: A :class:`_ReleaseMetadataCache` instance.
+        """
+        if getattr(self, "_release_cache_instance", None) is None:
+            location = self._release_cache_location
+            if not location:
+                try:
+                    from sgtk.util import LocalFileStorageManager
+                    root = LocalFileStorageManager.get_global_root(
+                        LocalFileStorageManager.CACHE
+                    )
+                except ImportError:
+                    root = tempfile.gettempdir()
+                location = os.path.join(root, "bootstrap", "github_releases")
+            self._release_cache_instance = _ReleaseMetadataCache(location)
+        return self._release_cache_instance
+
+    def _get_github_release(self, name, version, token):
+        """
+        Return the Github release for the given repository and tag.
+
+        Release metadata is cached on disk and revalidated with a conditional
+        ``If-None-Match`` request once :attr:`_release_cache_ttl` is elapsed.
+        Immutable releases are served from the cache without contacting Github.
+        Stale metadata is used if Github can't be reached.
+
+        :param str name: A Github repository name, e.g. ``org/repo``.
+        :param str version: The release tag.
+        :param str token: A Github OAuth or personal token.
+        :returns: A Github release dictionary.
+        """
+        with self._timed("release_metadata", repo=name, tag=version) as record:
+            return self._lookup_github_release(name, version, token, record)
+
+    def _lookup_github_release(self, name, version, token, record):
+        """
+        Retrieve the Github release for the given repository and tag, from the
+        cache if possible.
+
+        :param str name: A Github repository name, e.g. ``org/repo``.
+        :param str version: The release tag.
+        :param str token: A Github OAuth or personal token.
+        :param record: A timing record dictionary, its ``source`` key is set to
+                       where the release was retrieved from.
+        :returns: A Github release dictionary.
+        """
+        try:
+            from tank_vendor.six.moves.urllib import request as url2
+            from tank_vendor.six.moves.urllib import error as error_url2
+        except ImportError as e:
+            self.logger.warning(_SIX_IMPORT_WARNING)
+            self.logger.debug("%s" % e, exc_info=True)
+            # Fallback on using urllib2
+            import urllib2 as url2
+            import urllib2 as error_url2
+
+        entry = self._release_cache.load(name, version)
+        if entry:
+            if entry.get("immutable") or self._release_tags_immutable:
+                self.logger.debug("Using cached immutable release %s %s" % (name, version))
+                record["source"] = "cache"
+                return entry["release"]
+            if time.time() - entry.get("validated", 0) < self._release_cache_ttl:
+                self.logger.debug("Using cached release %s %s" % (name, version))
+                record["source"] = "cache"
+                return entry["release"]
+
+        # Retrieve the release from the tag
+        url = "https://api.github.com/repos/%s/releases/tags/%s" % (name, version)
+        request = url2.Request(url)
+        # Add the authorization token if we have one (private repos)
+        if token:
+            request.add_header("Authorization", "token %s" % token)
+        request.add_header("Accept", "application/vnd.github.v3+json")
+        if entry and entry.get("etag"):
+            request.add_header("If-None-Match", entry["etag"])
+        try:
+            response = self._http_session.open(request)
+        except error_url2.URLError as e:
+            if hasattr(e, "code"):
+                if e.code == 304:
+                    self.logger.debug("Cached release %s %s is up to date" % (name, version))
+                    entry["validated"] = time.time()
+                    self._release_cache.save(name, version, entry)
+                    record["source"] = "revalidated"
+                    return entry["release"]
+                if e.code == 404:
+                    self.logger.error("Release %s does not exists" % version)
+                elif e.code == 401:
+                    self.logger.error("Not authorised to access release %s." % version)
+            elif entry:
+                self.logger.warning(
+                    "Unable to reach Github (%s), using cached release %s %s" % (
+                        e, name, version
+                    )
+                )
+                record["source"] = "stale"
+                return entry["release"]
+            raise
+        release = json.loads(response.read())
+        record["source"] = "github"
+        self._release_cache.save(
+            name,
+            version,
+            {
+                "etag": response.headers.get("ETag"),
+                "validated": time.time(),
+                "immutable": bool(release.get("immutable")),
+                "release": release,
+            }
+        )
+        return release
+
+    def _fetch_assets(self, assets, destination, name, version, token):
+        """
+        Download and extract the given release assets into the destination folder.
+
+        Assets are fetched concurrently with a pool of at most
+        :attr:`_download_max_workers` threads if the Python ``concurrent.futures``
+        module is available, one after the other otherwise.
+
+        :param assets: A list of Github asset dictionaries.
+        :param str destination: Full path to a folder where to extract the assets.
+        :param str name: The Github repository name, e.g. ``org/repo``.
+        :param str version: The release version.
+        :param str token: A Github OAuth or personal token.
+        :returns: The list of assets which were extracted.
+        :raises RuntimeError: If any of the assets could not be retrieved.
+        """
+        if not assets:
+            return []
+        if not os.path.exists(destination):
+            self.logger.info("Creating %s" % destination)
+            os.makedirs(destination)
+
+        errors = []
+        workers = min(self._download_max_workers, len(assets))
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            workers = 1
+
+        if workers > 1:
+            self.logger.debug(
+                "Fetching %d assets with %d workers" % (len(assets), workers)
+            )
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    (
+                        asset,
+                        executor.submit(
+                            self._fetch_asset,
+                            asset,
+                            destination,
+                            name,
+                            version,
+                            token
+                        )
+                    ) for asset in assets
+                ]
+                for asset, future in futures:
+                    error = future.exception()
+                    if error:
+                        errors.append((asset, error))
+        else:
+            for asset in assets:
+                try:
+                    self._fetch_asset(asset, destination, name, version, token)
+                except Exception as e:
+                    errors.append((asset, e))
+
+        for asset, error in errors:
+            self.logger.error("Failed to retrieve %s: %s" % (asset["name"], error))
+        if errors:
+            # Raising here lets the bootstrap manager discard the whole bundle.
+            raise RuntimeError(
+                "Failed to retrieve %s" % ", ".join([a["name"] for a, _ in errors])
+            )
+        return assets
+
+    def _fetch_asset(self, asset, destination, name, version, token):
+        """
+        Extract the given release asset into the destination folder, from the
+        site mirror if it is available there, from Github otherwise.
+
+        :param asset: A Github asset dictionary.
+        :param str destination: Full path to a folder where to extract the asset.
+        :param str name: The Github repository name, e.g. ``org/repo``.
+        :param str version: The release version.
+        :param str token: A Github OAuth or personal token.
+        :raises RuntimeError: If the asset is neither on the mirror nor on Github.
+        """
+        try:
+            from tank_vendor.six.moves.urllib import request as url2
+            from tank_vendor.six.moves.urllib import error as error_url2
+        except ImportError as e:
+            self.logger.warning(_SIX_IMPORT_WARNING)
+            self.logger.debug("%s" % e, exc_info=True)
+            # Fallback on using urllib2
+            import urllib2 as url2
+            import urllib2 as error_url2
+
+        location = asset.get("mirror_path") or self._get_mirror_location(
+            name, version, asset["name"]
+        )
+        if location and re.match(r"https?://", location):
+            request = url2.Request(location)
+            try:
+                self._download_zip(request, asset, destination)
+                self.logger.debug("Retrieved %s from %s" % (asset["name"], location))
+                return
+            except error_url2.HTTPError as e:
+                if e.code != 404 or "url" not in asset:
+                    raise
+        elif location and os.path.isfile(location):
+            # Extract directly from the mirror, no need for a local copy.
+            if self._get_expected_checksum(asset):
+                self._check_checksum(asset, self._hash_file(location).hexdigest())
+            with self._timed("extract", asset=asset["name"], source=location):
+                self._extract_zip(location, destination)
+            self.logger.debug("Retrieved %s from %s" % (asset["name"], location))
+            return
+        if "url" not in asset:
+            raise RuntimeError(
+                "Asset %s is not available from %s" % (asset["name"], location)
+            )
+        if location:
+            self.logger.info(
+                "Asset %s is not available from the site mirror, downloading "
+                "it from Github" % asset["name"]
+            )
+        self._download_zip_github_asset(asset, destination, token)
+
+    def _should_download_release(self, desc):
+        """
+        Return a repo name and a token if the given descriptor should be downloaded
+        from a github release.
+
+        :param str desc: A Toolkit descriptor.
+        :returns: A name, token tuple or ``None``.
+        """
+        name = self._get_descriptor_repo_name(desc)
+        if not name:
+            return None
+        return self._github_releases_index.get(name.lower())
+
+    @property
+    def _github_releases_index(self):
+        """
+        Return a dictionary of the Github repositories to download releases from,
+        built once per hook instance.
+
+        Keys are lower case ``organization/repository`` strings, Github names
+        being case insensitive, and values name, token tuples. If a repository
+        is listed more than once, the first entry is used.
+
+        :returns: A dictionary.
+        """
+        if getattr(self, "_github_releases_index_instance", None) is None:
+            index = {}
+            repos = list(self._download_release_from_github)
+            repos.extend(self._load_github_releases_file())
+            for name, token in repos:
+                index.setdefault(name.lower(), (name, token))
+            self._github_releases_index_instance = index
+        return self._github_releases_index_instance
+
+    def _load_github_releases_file(self):
+        """
+        Load the Github repositories listed in :attr:`_download_release_from_github_file`.
+
+        :returns: A list of name, token tuples.
+        :raises ValueError: If the file content is invalid.
+        """
+        if not self._download_release_from_github_file:
+            return []
+        try:
+            from tank_vendor import yaml
+        except ImportError:
+            import yaml
+        path = os.path.expandvars(self._download_release_from_github_file)
+        with open(path, "r") as f:
+            entries = yaml.safe_load(f) or []
+        repos = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                name = entry.get("repository")
+                token = os.path.expandvars(entry.get("token") or "")
+            else:
+                name, token = entry, ""
+            if not name or len(name.split("/")) != 2:
+                raise ValueError(
+                    "Invalid Github repository %s in %s" % (entry, path)
+                )
+            repos.append((name, token))
+        self.logger.debug("Loaded %d Github repositories from %s" % (len(repos), path))
+        return repos
+
     def _download_zip_github_asset(self, asset, destination, token):
         """
         Download the zipped github asset and extract it into the given destination
@@ -205,6 +1032,18 @@ class Bootstrap(get_hook_baseclass()):
                             exist.
         :param str token: A Github OAuth or personal token.
         """
+        self._download_zip(
+            self._get_github_asset_request(asset, token), asset, destination
+        )
+
+    def _get_github_asset_request(self, asset, token):
+        """
+        Return a request to download the payload of the given github asset.
+
+        :param str asset: A Github asset dictionary.
+        :param str token: A Github OAuth or personal token.
+        :returns: A urllib ``Request``.
+        """
         try:
             from tank_vendor.six.moves.urllib import request as url2
         except ImportError as e:
@@ -212,42 +1051,344 @@ class Bootstrap(get_hook_baseclass()):
             self.logger.debug("%s" % e, exc_info=True)
             # Fallback on using urllib2
             import urllib2 as url2
-        # If we have a token use a basic auth handler
-        # just a http handler otherwise
-        if token:
-            passman = url2.HTTPPasswordMgrWithDefaultRealm()
-            passman.add_password(
-                None,
-                asset["url"],
-                token,
-                token
-            )
-            auth_handler = url2.HTTPBasicAuthHandler(passman)
-        else:
-            auth_handler = url2.HTTPHandler()
-
-        if self.shotgun.config.proxy_handler:
-            # Re-use proxy settings from the Shotgun connection
-            opener = url2.build_opener(
-                self.parent.shotgun.config.proxy_handler,
-                auth_handler
-            )
-        else:
-            opener = url2.build_opener(auth_handler)
-
-        url2.install_opener(opener)
         request = url2.Request(asset["url"])
         if token:
             # We will be redirected and the Auth shouldn't be in the header
             # for the redirection.
             request.add_unredirected_header("Authorization", "token %s" % token)
         request.add_header("Accept", "application/octet-stream")
-        response = url2.urlopen(request)
+        return request
+
+    def _set_expected_checksums(self, assets, release_assets, token):
+        """
+        Retrieve the SHA-256 checksums published with a release for the given
+        assets.
+
+        Checksums reported by Github for an asset are used if available.
+        Otherwise they are read from a ``<asset name>.sha256`` asset or from one
+        of the :attr:`_checksum_asset_names` assets, with the ``sha256sum``
+        output format. They are stored in the assets ``sha256`` key.
+
+        :param assets: A list of Github asset dictionaries to retrieve
+                       checksums for.
+        :param release_assets: All the Github asset dictionaries for the release.
+        :param str token: A Github OAuth or personal token.
+        """
+        by_name = dict([(a["name"], a) for a in release_assets])
+        checksums = {}
+        for checksum_name in self._checksum_asset_names:
+            if checksum_name in by_name:
+                checksums.update(
+                    self._read_checksums(by_name[checksum_name], token)
+                )
+        for asset in assets:
+            if self._get_expected_checksum(asset):
+                continue
+            checksum_asset = by_name.get("%s.sha256" % asset["name"])
+            if checksum_asset:
+                checksums.update(
+                    self._read_checksums(checksum_asset, token, asset["name"])
+                )
+            if asset["name"] in checksums:
+                asset["sha256"] = checksums[asset["name"]]
+
+    def _read_checksums(self, asset, token, default_name=None):
+        """
+        Download a checksums asset and parse it.
+
+        :param asset: A Github asset dictionary.
+        :param str token: A Github OAuth or personal token.
+        :param str default_name: Asset name for checksums without a file name.
+        :returns: A dictionary where keys are asset names and values SHA-256
+                  hexadecimal digests.
+        """
+        fd, tmp_file = tempfile.mkstemp(prefix="tk_bundle_", suffix=asset["name"])
+        os.close(fd)
+        try:
+            self._stream_asset_to_file(
+                self._get_github_asset_request(asset, token),
+                tmp_file,
+                asset.get("size"),
+            )
+            with open(tmp_file, "r") as f:
+                lines = f.read().splitlines()
+        finally:
+            os.remove(tmp_file)
+        checksums = {}
+        for line in lines:
+            parts = line.split()
+            if len(parts) == 1 and default_name:
+                checksums[default_name] = parts[0].lower()
+            elif len(parts) == 2:
+                # sha256sum prefixes file names with a "*" in binary mode.
+                checksums[parts[1].lstrip("*")] = parts[0].lower()
+        return checksums
+
+    def _get_expected_checksum(self, asset):
+        """
+        Return the expected SHA-256 checksum for the given asset.
+
+        :param asset: A Github asset dictionary.
+        :returns: A hexadecimal digest or ``None``.
+        """
+        digest = asset.get("digest") or ""
+        if digest.startswith("sha256:"):
+            return digest[len("sha256:"):].lower()
+        return asset.get("sha256")
+
+    def _check_checksum(self, asset, checksum):
+        """
+        Check the given checksum matches the expected one for the asset.
+
+        :param asset: A Github asset dictionary.
+        :param str checksum: A SHA-256 hexadecimal digest.
+        :raises RuntimeError: If the checksums do not match.
+        """
+        expected = self._get_expected_checksum(asset)
+        if expected and expected != checksum:
+            raise RuntimeError(
+                "Checksum mismatch for %s: expected %s, got %s" % (
+                    asset["name"], expected, checksum
+                )
+            )
+        if expected:
+            self.logger.debug("Verified checksum for %s" % asset["name"])
+
+    def _hash_file(self, path):
+        """
+        Return a SHA-256 ``hashlib`` object for the given file content.
+
+        :param str path: Full path to the file.
+        :returns: A ``hashlib`` object.
+        """
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self._download_chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        return hasher
+
+    def _download_zip(self, request, asset, destination):
+        """
+        Download a zipped archive and extract it into the given destination
+        folder.
+
+        The archive is downloaded to a temporary file outside of the destination
+        folder, checked against the expected checksum for the asset if any, and
+        deleted once extracted.
+
+        :param request: A urllib ``Request`` for the archive.
+        :param asset: A Github asset dictionary.
+        :param str destination: Full path to a folder where to extract the
+                                downloaded archive. The folder is created if it
+                                does not exist.
+        """
         if not os.path.exists(destination):
             self.logger.info("Creating %s" % destination)
             os.makedirs(destination)
-        tmp_file = os.path.join(destination, asset["name"])
-        with open(tmp_file, "wb") as f:
-            f.write(response.read())
-        with zipfile.ZipFile(tmp_file, "r") as zip_ref:
-            zip_ref.extractall(destination)
+        fd, tmp_file = tempfile.mkstemp(prefix="tk_bundle_", suffix=asset["name"])
+        os.close(fd)
+        try:
+            with self._timed(
+                "download", asset=asset["name"], source=request.get_full_url()
+            ) as record:
+                checksum = self._stream_asset_to_file(request, tmp_file, asset.get("size"))
+                record["bytes"] = os.path.getsize(tmp_file)
+            self._check_checksum(asset, checksum)
+            with self._timed("extract", asset=asset["name"]):
+                self._extract_zip(tmp_file, destination)
+        finally:
+            os.remove(tmp_file)
+
+    def _extract_zip(self, path, destination):
+        """
+        Extract the given zipped archive into the destination folder.
+
+        Archives with at least :attr:`_extract_parallel_min_files` files are
+        extracted with a pool of threads, each of them reading the archive
+        with its own file handle.
+
+        :param str path: Full path to the archive.
+        :param str destination: Full path to the folder where to extract it.
+        """
+        with self._extract_lock:
+            with zipfile.ZipFile(path, "r") as zip_ref:
+                members = zip_ref.infolist()
+                workers = self._download_max_workers
+                if len(members) < self._extract_parallel_min_files or workers < 2:
+                    zip_ref.extractall(destination)
+                    return
+                try:
+                    from concurrent.futures import ThreadPoolExecutor
+                except ImportError:
+                    zip_ref.extractall(destination)
+                    return
+                # Create all folders upfront so workers don't race to create
+                # them. Folder names are sanitized the same way zipfile does.
+                files = []
+                folders = set()
+                for member in members:
+                    if member.filename.endswith("/"):
+                        zip_ref.extract(member, destination)
+                        continue
+                    files.append(member)
+                    folders.add(tuple(
+                        p for p in os.path.dirname(member.filename).split("/")
+                        if p not in ("", ".", "..")
+                    ))
+                for folder in folders:
+                    folder = os.path.join(destination, *folder)
+                    if not os.path.isdir(folder):
+                        os.makedirs(folder)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._extract_zip_members,
+                        path,
+                        files[i::workers],
+                        destination
+                    ) for i in range(workers)
+                ]
+                for future in futures:
+                    future.result()
+
+    def _extract_zip_members(self, path, members, destination):
+        """
+        Extract some members of the given zipped archive into the destination
+        folder.
+
+        :param str path: Full path to the archive.
+        :param members: A list of ``ZipInfo`` instances.
+        :param str destination: Full path to the folder where to extract them.
+        """
+        with zipfile.ZipFile(path, "r") as zip_ref:
+            for member in members:
+                zip_ref.extract(member, destination)
+
+    def _stream_asset_to_file(self, request, path, size=None):
+        """
+        Download the payload for the given request into a file, chunk by chunk.
+
+        If the connection drops before the whole payload was retrieved, the
+        download is resumed from the last byte written to disk with a HTTP
+        ``Range`` request, up to :attr:`_download_max_resumes` times.
+
+        :param request: A urllib ``Request`` for the payload.
+        :param str path: Full path to the file to write.
+        :param int size: The expected payload size in bytes, if known.
+        :returns: The SHA-256 hexadecimal digest of the payload.
+        :raises RuntimeError: If the payload can't be fully retrieved.
+        """
+        try:
+            from tank_vendor.six.moves.urllib import error as error_url2
+            from tank_vendor.six.moves import http_client
+        except ImportError as e:
+            self.logger.warning(_SIX_IMPORT_WARNING)
+            self.logger.debug("%s" % e, exc_info=True)
+            # Fallback on using urllib2
+            import urllib2 as error_url2
+            import httplib as http_client
+
+        name = os.path.basename(path)
+        written = 0
+        resumes = 0
+        start = time.time()
+        hasher = hashlib.sha256()
+        while True:
+            if written:
+                request.add_header("Range", "bytes=%d-" % written)
+            else:
+                request.headers.pop("Range", None)
+            try:
+                response = self._http_session.open(request)
+                if written and response.getcode() != 206:
+                    # The server ignored our Range request and is sending
+                    # the whole payload again: start over.
+                    self.logger.debug(
+                        "Server does not support resuming %s, restarting download" % name
+                    )
+                    written = 0
+                if not written:
+                    hasher = hashlib.sha256()
+                elif hasher is None:
+                    hasher = self._hash_file(path)
+                self._write_response_chunks(
+                    response, path, written, size, start, hasher
+                )
+                written = os.path.getsize(path)
+                if size is None or written >= size:
+                    break
+                raise http_client.IncompleteRead(b"", size - written)
+            except error_url2.HTTPError as e:
+                if e.code == 416 and size is not None and written >= size:
+                    # Nothing left to retrieve.
+                    break
+                raise
+            except (error_url2.URLError, http_client.HTTPException, IOError) as e:
+                # We don't know if the last chunk was hashed, the partial file
+                # will be hashed again when resuming.
+                hasher = None
+                if os.path.exists(path):
+                    written = os.path.getsize(path)
+                resumes += 1
+                if resumes > self._download_max_resumes:
+                    raise RuntimeError(
+                        "Giving up downloading %s after %d attempts: %s" % (
+                            name, resumes, e
+                        )
+                    )
+                self.logger.warning(
+                    "Download of %s interrupted after %d bytes (%s), resuming..." % (
+                        name, written, e
+                    )
+                )
+        duration = max(time.time() - start, 0.001)
+        self.logger.info(
+            "Downloaded %s: %d bytes in %.1fs (%.0f bytes/sec)" % (
+                name, written, duration, written / duration
+            )
+        )
+        if hasher is None:
+            hasher = self._hash_file(path)
+        return hasher.hexdigest()
+
+    def _write_response_chunks(self, response, path, offset, size, start, hasher):
+        """
+        Write the payload of the given response to a file, chunk by chunk, and
+        log the download progress.
+
+        :param response: A urllib response.
+        :param str path: Full path to the file to write.
+        :param int offset: Number of bytes already written to the file. The
+                           response payload is appended to the file if not 0.
+        :param int size: The expected payload size in bytes, if known.
+        :param float start: Time at which the download was started.
+        :param hasher: A ``hashlib`` object updated with the written chunks.
+        """
+        name = os.path.basename(path)
+        written = offset
+        last_report = time.time()
+        try:
+            with open(path, "ab" if offset else "wb") as f:
+                while True:
+                    chunk = response.read(self._download_chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    written += len(chunk)
+                    now = time.time()
+                    if now - last_report >= self._download_progress_interval:
+                        last_report = now
+                        self.logger.info(
+                            "Downloading %s: %d/%s bytes (%.0f bytes/sec)" % (
+                                name,
+                                written,
+                                size if size is not None else "?",
+                                written / max(now - start, 0.001),
+                            )
+                        )
+        finally:
+            response.close()
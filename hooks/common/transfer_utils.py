@@ -0,0 +1,151 @@
+# Copyright (c) 2020 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+
+import sgtk
+
+HookBaseClass = sgtk.get_hook_baseclass()
+
+# Matches the frame number token of an image sequence file name, e.g. %04d, ####, $F4.
+# Characters like # or @ can also be part of a plain file name, a path is only handled
+# as an image sequence if frames are found for it.
+FRAME_TOKEN_REGEX = re.compile(r"%0?(\d*)d|#+|@+|\{SEQ\}|\$F(\d?)(?![A-Za-z])")
+
+
+class TransferUtils(HookBaseClass):
+    """
+    Helpers shared by the config hooks transferring files: image sequence handling
+    and running calls with a pool of threads.
+
+    Hooks can't import each other, this hook is loaded from the other hooks with::
+
+        self.parent.create_hook_instance("{config}/common/transfer_utils.py")
+    """
+
+    def run_in_parallel(self, func, args_list, max_workers, callback=None):
+        """
+        Call a function for each arguments tuple with a pool of threads, or one
+        after the other if ``concurrent.futures`` is not available.
+
+        Errors are returned instead of being raised, so the caller decides how to
+        handle them. Calls run in worker threads: the function must not use the
+        logger or Qt GUI objects like widgets or ``QPixmap``, which only work from
+        the main thread. Thread safe Qt classes like ``QImage``, ``QByteArray`` or
+        ``QBuffer`` can be used.
+
+        :param func: The function to call.
+        :param args_list: A list of arguments tuples.
+        :param int max_workers: Maximum number of calls running at the same time.
+        :param callback: Optional callable called from the current thread each time
+            a call completes, with the index of its arguments, its result and its error.
+        :returns: A list of (result, error) tuples, in the arguments order.
+        """
+        results = [None] * len(args_list)
+
+        def call(index):
+            try:
+                results[index] = (func(*args_list[index]), None)
+            except Exception as e:
+                results[index] = (None, e)
+            if callback:
+                callback(index, *results[index])
+
+        workers = min(max_workers, len(args_list))
+        try:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+        except ImportError:
+            workers = 1
+
+        if workers < 2:
+            for index in range(len(args_list)):
+                call(index)
+            return results
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = dict(
+                (executor.submit(func, *args), index) for index, args in enumerate(args_list)
+            )
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = (future.result(), None)
+                except Exception as e:
+                    results[index] = (None, e)
+                if callback:
+                    callback(index, *results[index])
+        return results
+
+    def is_sequence_path(self, path):
+        """
+        :param str path: A file path.
+        :returns: True if the file name contains a frame number token. Use
+            :meth:`expand_sequence` to check the sequence has frames.
+        """
+        return bool(FRAME_TOKEN_REGEX.search(os.path.basename(path)))
+
+    def expand_sequence(self, path, frame_paths=None):
+        """
+        Get the frames of an image sequence. Only the files whose frame number is
+        padded like the frame token are returned, e.g. ``render.0001.exr`` but not
+        ``render.1.exr`` for ``render.%04d.exr``.
+
+        :param str path: Image sequence path, e.g. ``/path/render.%04d.exr``.
+        :param frame_paths: Optional list of paths to match against the sequence,
+            the sequence folder is listed if not provided.
+        :returns: A list of (frame number, frame path) tuples, sorted by frame number.
+        """
+        folder, file_name = os.path.split(path)
+        match = FRAME_TOKEN_REGEX.search(file_name)
+        frame_regex = re.compile(
+            r"^%s(-?\d+)%s$"
+            % (re.escape(file_name[: match.start()]), re.escape(file_name[match.end():]))
+        )
+        if frame_paths is None:
+            try:
+                frame_paths = [os.path.join(folder, name) for name in os.listdir(folder)]
+            except OSError:
+                return []
+
+        frames = []
+        for frame_path in frame_paths:
+            frame_name = os.path.basename(frame_path)
+            frame_match = frame_regex.match(frame_name)
+            if not frame_match:
+                continue
+            frame = int(frame_match.group(1))
+            if os.path.basename(self.get_frame_path(path, frame)) == frame_name:
+                frames.append((frame, frame_path))
+        return sorted(frames)
+
+    def get_frame_path(self, path, frame):
+        """
+        Get the path of a frame of an image sequence, padded like the frame token.
+
+        :param str path: Image sequence path, e.g. ``/path/render.%04d.exr``.
+        :param int frame: The frame number.
+        :returns: The frame path, e.g. ``/path/render.1001.exr``.
+        """
+        folder, file_name = os.path.split(path)
+        match = FRAME_TOKEN_REGEX.search(file_name)
+        token = match.group(0)
+        if token.startswith("%"):
+            padding = int(match.group(1) or 1)
+        elif token.startswith("$F"):
+            padding = int(match.group(2) or 1)
+        elif token == "{SEQ}":
+            padding = 4
+        else:
+            padding = len(token)
+        return os.path.join(
+            folder,
+            "%s%0*d%s" % (file_name[: match.start()], padding, frame, file_name[match.end():]),
+        )
@@ -11,9 +11,14 @@
 """
 Hook that provides upload and download functionality for the cloud storage provider.
 """
+import errno
+import hashlib
+import json
 import os
+import re
 import sgtk
 import platform
+import threading
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
@@ -23,12 +28,41 @@ class LocalProvider(HookBaseClass):
     """
     This hooks is just an example hook that doesn't actually upload anything,
     but instead copies thee files to a location, and then retrieves them on download.
+
+    Files are stored by content: each file is stored once under its SHA-256 digest
+    in sharded sub folders, and a small index maps PublishedFile ids to digests::
+
+        objects/<digest[0:2]>/<digest[2:4]>/<digest>
+        index/<id digest[0:2]>/<id>.json
+
+    All index entries are also appended to a ``manifest.jsonl`` file, loaded once and
+    then read incrementally, so presence checks are answered in memory instead of
+    probing the remote storage for each file.
+
+    Image sequences, e.g. ``/path/render.%04d.exr``, are stored frame by frame, and
+    their index entry maps each frame number to the digest and file name of the frame.
     """
     if platform.system() == 'Windows':
         remote_storage_location = "$HOME/mock_remote_storage"
     elif platform.system() == 'Darwin':
         remote_storage_location = '/Users/johnnyzxt/temp/test'
 
+    # Size of the chunks read when computing file digests.
+    hash_chunk_size = 1024 * 1024
+    # Size of the chunks used when files have to be copied byte by byte.
+    copy_chunk_size = 8 * 1024 * 1024
+    # Whether files can be hard linked instead of copied when the remote storage
+    # and the project share a file system. Hard linked files share their content, so
+    # linked files are made read-only: writing one of them in place would otherwise
+    # change the stored content of every PublishedFile sharing its digest.
+    allow_hardlinks = False
+    # Maximum number of image sequence frames transferred at the same time.
+    transfer_max_workers = 8
+    # Linux FICLONE ioctl request, to clone files on copy-on-write file systems.
+    _FICLONE = 0x40049409
+    _stats_lock = threading.Lock()
+    _manifest_lock = threading.Lock()
+
     def upload(self, published_file):
         """
         This method should contain any logic for uploading the file to the remote storage.
@@ -45,18 +79,30 @@ class LocalProvider(HookBaseClass):
             and "local_path" in published_file["path"]
             and published_file["path"]["local_path"]
         ):
-            # Build a path to copy the published file to in our mocked remote storage.
-            destination_path = self._generate_remote_path(published_file)
-            self.logger.info("mock uploading file to %s" % destination_path)
-            if os.path.exists(destination_path):
+            if self._find_remote_path(published_file):
                 self.logger.warning(
                     "PublishedFile already exists in remote location: %s"
                     % published_file
                 )
                 return
 
-            sgtk.util.filesystem.copy_file(
-                published_file["path"]["local_path"], destination_path
+            local_path = published_file["path"]["local_path"]
+            transfer_utils = self._get_transfer_utils()
+            if not os.path.isfile(local_path) and transfer_utils.is_sequence_path(local_path):
+                # file names can contain # or @ without being a sequence, only
+                # upload a sequence if frames are found
+                frames = transfer_utils.expand_sequence(local_path)
+                if frames:
+                    return self._upload_sequence(published_file, frames)
+
+            digest, destination_path = self._store_file(local_path)
+            self._record_entry(
+                published_file["id"],
+                {
+                    "digest": digest,
+                    "name": published_file["name"],
+                    "size": os.path.getsize(local_path),
+                },
             )
             return destination_path
 
@@ -64,18 +110,24 @@ class LocalProvider(HookBaseClass):
             "No local file path found on PublishedFile: %s" % published_file
         )
 
-    def download(self, published_file):
+    def download(self, published_file, frame_range=None):
         """
         Downloads the PublishedFile from the remote storage.
         This method is responsible for finding the file in the remote storage based on
         the passed published_file.
         :param published_file: dict, PublishedFile entity.
+        :param frame_range: Optional first, last frame numbers tuple, to only download
+            some frames of an image sequence.
         :return: str; The path to the downloaded file.
         """
         self.logger.info("downloading %s" % published_file)
 
-        remote_path = self._generate_remote_path(published_file)
-        if not os.path.exists(remote_path):
+        entry = self._lookup_entry(published_file["id"])
+        if entry and "frames" in entry:
+            return self._download_sequence(published_file, entry, frame_range)
+
+        remote_path = self._find_remote_path(published_file)
+        if not remote_path:
             self.logger.warning(
                 "PublishedFile %s could not be found in the remote storage."
                 % published_file["id"]
@@ -93,12 +145,540 @@ class LocalProvider(HookBaseClass):
             )
             return
 
-        sgtk.util.filesystem.copy_file(remote_path, destination)
+        self._transfer_file(remote_path, destination)
+        return destination
+
+    def download_frames(self, published_file, first, last):
+        """
+        Downloads some frames of an image sequence PublishedFile from the remote storage.
+        (This is not a required hook method)
+        :param published_file: dict, PublishedFile entity.
+        :param first: int, first frame to download.
+        :param last: int, last frame to download.
+        :return: str; The path to the downloaded image sequence.
+        """
+        return self.download(published_file, frame_range=(first, last))
+
+    def _store_file(self, local_path):
+        """
+        Stores the content of a file in the remote storage, if not already stored.
+        (This is not a required hook method)
+        :param local_path: str, path to the file to store.
+        :return: A digest, path to the stored content tuple.
+        """
+        digest = self._get_file_digest(local_path)
+        # Build a path to copy the published file to in our mocked remote storage.
+        destination_path = self._generate_object_path(digest)
+        if os.path.exists(destination_path):
+            # Same content was already uploaded, only record the PublishedFile.
+            self.logger.info(
+                "Content of %s already in remote location: %s"
+                % (local_path, destination_path)
+            )
+        else:
+            self.logger.info("mock uploading file to %s" % destination_path)
+            # Copy to a temporary file first so a partially copied file is never
+            # considered as stored.
+            tmp_path = self._generate_tmp_path(destination_path)
+            self._transfer_file(local_path, tmp_path)
+            self._replace_file(tmp_path, destination_path)
+        return digest, destination_path
+
+    def _upload_sequence(self, published_file, frames):
+        """
+        Uploads all the frames of an image sequence PublishedFile, as one batch.
+        (This is not a required hook method)
+        :param published_file: dict, PublishedFile entity.
+        :param frames: list of frame number, frame path tuples.
+        :return: str path to the index entry for the sequence.
+        """
+        digests = self._run_batch(
+            self._store_file, [(frame_path,) for _, frame_path in frames]
+        )
+        self._record_entry(
+            published_file["id"],
+            {
+                "name": published_file["name"],
+                "size": sum([os.path.getsize(frame_path) for _, frame_path in frames]),
+                "frames": dict(
+                    (str(frame), {"digest": digest, "name": os.path.basename(frame_path)})
+                    for (frame, frame_path), (digest, _) in zip(frames, digests)
+                ),
+            },
+        )
+        self.logger.info(
+            "Uploaded %d frames for PublishedFile %s" % (len(frames), published_file["id"])
+        )
+        return self._generate_index_path(published_file["id"])
+
+    def _download_sequence(self, published_file, entry, frame_range=None):
+        """
+        Downloads the frames of an image sequence PublishedFile, as one batch.
+        Frames which already exist locally are skipped.
+        (This is not a required hook method)
+        :param published_file: dict, PublishedFile entity.
+        :param entry: dict, the index entry for the PublishedFile.
+        :param frame_range: Optional first, last frame numbers tuple.
+        :return: str; The path to the downloaded image sequence.
+        """
+        destination = published_file["path"]["local_path"]
+        folder = os.path.dirname(destination)
+        transfers = []
+        for frame, frame_entry in sorted(entry["frames"].items(), key=lambda f: int(f[0])):
+            if frame_range and not frame_range[0] <= int(frame) <= frame_range[1]:
+                continue
+            frame_path = os.path.join(folder, frame_entry["name"])
+            if os.path.exists(frame_path):
+                continue
+            remote_path = self._generate_object_path(frame_entry["digest"])
+            if not os.path.exists(remote_path):
+                self.logger.warning(
+                    "Frame %s of PublishedFile %s could not be found in the remote storage."
+                    % (frame, published_file["id"])
+                )
+                return None
+            transfers.append((remote_path, frame_path))
+
+        self._run_batch(self._transfer_file, transfers)
+        self.logger.info(
+            "Downloaded %d frames for PublishedFile %s" % (len(transfers), published_file["id"])
+        )
         return destination
 
+    def _run_batch(self, func, args_list):
+        """
+        Calls a function for each arguments tuple with a pool of
+        transfer_max_workers threads.
+        (This is not a required hook method)
+        :return: list of results, in the same order as the arguments.
+        """
+        results = self._get_transfer_utils().run_in_parallel(
+            func, args_list, self.transfer_max_workers
+        )
+        for _, error in results:
+            if error is not None:
+                raise error
+        return [result for result, _ in results]
+
+    def _get_transfer_utils(self):
+        """
+        :return: The hook shared by the config hooks to handle image sequences and
+            run transfers in parallel.
+        (This is not a required hook method)
+        """
+        if getattr(self, "_transfer_utils", None) is None:
+            self._transfer_utils = self.parent.create_hook_instance(
+                "{config}/common/transfer_utils.py"
+            )
+        return self._transfer_utils
+
+    def _transfer_file(self, source, destination):
+        """
+        Transfers a file to the given destination, with the fastest strategy the
+        storage allows: a reflink clone, then a hard link, then a chunked copy.
+        The strategy used is logged and counted in the transfer_stats dictionary.
+        (This is not a required hook method)
+        :param source: str, path to the file to transfer.
+        :param destination: str, path to the destination file, which must not exist.
+        :return: str; The strategy used: "reflink", "hardlink" or "copy".
+        """
+        sgtk.util.filesystem.ensure_folder_exists(os.path.dirname(destination))
+        if self._reflink_file(source, destination):
+            strategy = "reflink"
+        elif self._hardlink_file(source, destination):
+            strategy = "hardlink"
+        else:
+            self._copy_file_chunks(source, destination)
+            strategy = "copy"
+        if strategy == "hardlink":
+            # Both paths share the stored content, it must not be modified in place.
+            os.chmod(destination, 0o444)
+        else:
+            # Same permissions as sgtk.util.filesystem.copy_file
+            os.chmod(destination, 0o666)
+        self.logger.debug(
+            "Transferred %s to %s with %s" % (source, destination, strategy)
+        )
+        with self._stats_lock:
+            if getattr(self, "transfer_stats", None) is None:
+                self.transfer_stats = {}
+            self.transfer_stats[strategy] = self.transfer_stats.get(strategy, 0) + 1
+        return strategy
+
+    def _reflink_file(self, source, destination):
+        """
+        Clones a file with the Linux FICLONE ioctl, so both files share their
+        data blocks until one of them is modified.
+        (This is not a required hook method)
+        :return: bool; True if the file was cloned.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            return False
+        if platform.system() != "Linux":
+            return False
+        with open(source, "rb") as src:
+            with open(destination, "wb") as dst:
+                try:
+                    fcntl.ioctl(dst.fileno(), self._FICLONE, src.fileno())
+                    return True
+                except (IOError, OSError):
+                    pass
+        os.remove(destination)
+        return False
+
+    def _hardlink_file(self, source, destination):
+        """
+        Hard links a file if allowed and the destination is on the same file system.
+        The caller makes the linked file read-only.
+        (This is not a required hook method)
+        :return: bool; True if the file was linked.
+        """
+        if not self.allow_hardlinks or not hasattr(os, "link"):
+            return False
+        if os.stat(source).st_dev != os.stat(os.path.dirname(destination)).st_dev:
+            return False
+        try:
+            os.link(source, destination)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                raise
+            return False
+        return True
+
+    def _copy_file_chunks(self, source, destination):
+        """
+        Copies a file with large chunks, using os.sendfile if available so the data
+        is copied without going through user space.
+        (This is not a required hook method)
+        """
+        with open(source, "rb") as src:
+            with open(destination, "wb") as dst:
+                if hasattr(os, "sendfile") and platform.system() == "Linux":
+                    offset = 0
+                    size = os.fstat(src.fileno()).st_size
+                    while offset < size:
+                        sent = os.sendfile(
+                            dst.fileno(), src.fileno(), offset, self.copy_chunk_size
+                        )
+                        if not sent:
+                            break
+                        offset += sent
+                    return
+                while True:
+                    chunk = src.read(self.copy_chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+
+    def _find_remote_path(self, published_file):
+        """
+        Return the path to the content of the given PublishedFile on the remote
+        storage.
+        (This is not a required hook method)
+        :param published_file: dict, PublishedFile entity.
+        :return: str path to the stored file or None if it is not stored.
+        """
+        entry = self._lookup_entry(published_file["id"])
+        if not entry:
+            # Files written with the legacy flat layout, e.g. by older clients, are
+            # only added to the manifest when it is built.
+            legacy_path = self._generate_remote_path(published_file)
+            if os.path.exists(legacy_path):
+                return legacy_path
+            return None
+        if "frames" in entry:
+            return self._generate_index_path(published_file["id"])
+        if "legacy_name" in entry:
+            # Files uploaded before content addressing was introduced.
+            return os.path.join(self._get_root(), entry["legacy_name"])
+        return self._generate_object_path(entry["digest"])
+
+    def exists_remotely(self, published_files):
+        """
+        Checks which PublishedFiles are stored in the remote storage, from the
+        manifest, only probing the index and the legacy flat layout for
+        PublishedFiles missing from the manifest.
+        (This is not a required hook method)
+        :param published_files: list of PublishedFile entity dicts.
+        :return: dict, PublishedFile ids to booleans.
+        """
+        manifest = self._get_manifest(refresh=True)
+        return dict(
+            (
+                published_file["id"],
+                str(published_file["id"]) in manifest
+                or self._load_index_entry(published_file["id"]) is not None
+                or os.path.exists(self._generate_remote_path(published_file)),
+            )
+            for published_file in published_files
+        )
+
+    def missing_locally(self, published_files):
+        """
+        Returns the PublishedFiles which are not available at their local path.
+        Each local folder is listed once instead of checking each file.
+        (This is not a required hook method)
+        :param published_files: list of PublishedFile entity dicts.
+        :return: list of the PublishedFile entity dicts missing locally.
+        """
+        listings = {}
+
+        def exists(path):
+            folder, file_name = os.path.split(path)
+            if folder not in listings:
+                try:
+                    listings[folder] = set(os.listdir(folder))
+                except OSError:
+                    listings[folder] = set()
+            return file_name in listings[folder]
+
+        missing = []
+        for published_file in published_files:
+            local_path = published_file["path"]["local_path"]
+            entry = self._lookup_entry(published_file["id"], refresh=False)
+            if entry and "frames" in entry:
+                folder = os.path.dirname(local_path)
+                present = all(
+                    exists(os.path.join(folder, frame_entry["name"]))
+                    for frame_entry in entry["frames"].values()
+                )
+            else:
+                present = exists(local_path)
+            if not present:
+                missing.append(published_file)
+        return missing
+
+    def _get_manifest_path(self):
+        """
+        :return: str path to the remote storage manifest.
+        (This is not a required hook method)
+        """
+        return os.path.join(self._get_root(), "manifest.jsonl")
+
+    def _get_manifest(self, refresh=False):
+        """
+        Returns the in memory remote storage manifest. It is loaded on first access,
+        built from the index if it doesn't exist yet.
+        (This is not a required hook method)
+        :param refresh: bool, read entries appended by other processes since the
+            last access.
+        :return: dict, PublishedFile ids, as strings, to index entries.
+        """
+        with self._manifest_lock:
+            if getattr(self, "_manifest", None) is None:
+                self._manifest = {}
+                self._manifest_offset = 0
+                if not os.path.exists(self._get_manifest_path()):
+                    self._build_manifest()
+                refresh = True
+            if refresh:
+                self._read_manifest()
+            return self._manifest
+
+    def _lookup_entry(self, published_file_id, refresh=True):
+        """
+        Returns the index entry for a PublishedFile id from the manifest.
+        (This is not a required hook method)
+        :param published_file_id: int, PublishedFile id.
+        :param refresh: bool, read entries appended by other processes if the id
+            is not found.
+        :return: dict or None.
+        """
+        entry = self._get_manifest().get(str(published_file_id))
+        if entry is None and refresh:
+            entry = self._get_manifest(refresh=True).get(str(published_file_id))
+            if entry is None:
+                entry = self._load_index_entry(published_file_id)
+        return entry
+
+    def _load_index_entry(self, published_file_id):
+        """
+        Reads the index entry for a PublishedFile id missing from the manifest and
+        caches it in the in memory manifest.
+
+        Manifest appends from several hosts are not atomic, e.g. on NFS, so a line
+        can be lost or garbled while the index entry was written.
+        (This is not a required hook method)
+        :param published_file_id: int, PublishedFile id.
+        :return: dict or None.
+        """
+        entry = self._read_index_entry(published_file_id)
+        if entry is not None:
+            with self._manifest_lock:
+                self._manifest[str(published_file_id)] = entry
+        return entry
+
+    def _read_manifest(self):
+        """
+        Reads the manifest entries appended since the last read.
+        (This is not a required hook method)
+        """
+        # Read raw bytes so the offset is not shifted by newline translation.
+        try:
+            with open(self._get_manifest_path(), "rb") as f:
+                f.seek(self._manifest_offset)
+                data = f.read()
+        except (IOError, OSError):
+            return
+        # Only consume complete lines, the last one could still be being written.
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            self._manifest[str(record["id"])] = record["entry"]
+        self._manifest_offset += end
+
+    def _build_manifest(self):
+        """
+        Builds the manifest from the index entries and the files stored with the
+        legacy flat layout. This is only done once for a remote storage.
+        (This is not a required hook method)
+        """
+        root = self._get_root()
+        records = []
+        index_root = os.path.join(root, "index")
+        for folder, _, file_names in os.walk(index_root):
+            for file_name in file_names:
+                if not file_name.endswith(".json"):
+                    continue
+                published_file_id = file_name[:-len(".json")]
+                entry = self._read_index_entry(published_file_id)
+                if entry:
+                    records.append({"id": published_file_id, "entry": entry})
+        if os.path.isdir(root):
+            for file_name in os.listdir(root):
+                match = re.match(r"^(\d+)_", file_name)
+                if match and os.path.isfile(os.path.join(root, file_name)):
+                    records.append(
+                        {"id": match.group(1), "entry": {"legacy_name": file_name}}
+                    )
+        sgtk.util.filesystem.ensure_folder_exists(root)
+        manifest_path = self._get_manifest_path()
+        tmp_path = self._generate_tmp_path(manifest_path)
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(("%s\n" % json.dumps(record)).encode("utf-8"))
+        if not os.path.exists(manifest_path):
+            self._replace_file(tmp_path, manifest_path)
+        else:
+            # Built by another process in the meantime.
+            os.remove(tmp_path)
+
+    def _record_entry(self, published_file_id, entry):
+        """
+        Writes the index entry for a PublishedFile id and appends it to the manifest.
+        (This is not a required hook method)
+        :param published_file_id: int, PublishedFile id.
+        :param entry: dict, the index entry.
+        """
+        self._write_index_entry(published_file_id, entry)
+        manifest = self._get_manifest()
+        with self._manifest_lock:
+            with open(self._get_manifest_path(), "ab") as f:
+                f.write(
+                    ("%s\n" % json.dumps({"id": published_file_id, "entry": entry})).encode(
+                        "utf-8"
+                    )
+                )
+            manifest[str(published_file_id)] = entry
+
+    def _get_root(self):
+        """
+        Return the root folder of the remote storage.
+        (This is not a required hook method)
+        """
+        return os.path.expandvars(self.remote_storage_location)
+
+    def _generate_object_path(self, digest):
+        """
+        Works out the path for the content with the given digest on the remote storage.
+        (This is not a required hook method)
+        :param digest: str, SHA-256 hexadecimal digest.
+        :return: str path to the stored content.
+        """
+        return os.path.join(self._get_root(), "objects", digest[:2], digest[2:4], digest)
+
+    def _generate_index_path(self, published_file_id):
+        """
+        Works out the path for the index entry of a PublishedFile id.
+        (This is not a required hook method)
+        :param published_file_id: int, PublishedFile id.
+        :return: str path to the index entry.
+        """
+        shard = hashlib.sha1(str(published_file_id).encode("utf-8")).hexdigest()[:2]
+        return os.path.join(
+            self._get_root(), "index", shard, "%s.json" % published_file_id
+        )
+
+    def _read_index_entry(self, published_file_id):
+        """
+        Read the index entry for a PublishedFile id.
+        (This is not a required hook method)
+        :param published_file_id: int, PublishedFile id.
+        :return: dict with the digest, name and size of the stored content or None.
+        """
+        try:
+            with open(self._generate_index_path(published_file_id), "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_index_entry(self, published_file_id, entry):
+        """
+        Write the index entry for a PublishedFile id.
+        (This is not a required hook method)
+        :param published_file_id: int, PublishedFile id.
+        :param entry: dict with the digest, name and size of the stored content.
+        """
+        index_path = self._generate_index_path(published_file_id)
+        sgtk.util.filesystem.ensure_folder_exists(os.path.dirname(index_path))
+        tmp_path = self._generate_tmp_path(index_path)
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        self._replace_file(tmp_path, index_path)
+
+    def _generate_tmp_path(self, path):
+        """
+        Works out a temporary path, unique to the current process and thread,
+        next to the given path.
+        (This is not a required hook method)
+        """
+        return "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+
+    def _replace_file(self, source, destination):
+        """
+        Rename a file, replacing the destination if it exists.
+        (This is not a required hook method)
+        """
+        sgtk.util.filesystem.ensure_folder_exists(os.path.dirname(destination))
+        if os.path.exists(destination) and platform.system() == "Windows":
+            # os.rename does not overwrite existing files on Windows
+            os.remove(destination)
+        os.rename(source, destination)
+
+    def _get_file_digest(self, path):
+        """
+        Compute the SHA-256 digest of a file.
+        (This is not a required hook method)
+        :param path: str, path to the file.
+        :return: str hexadecimal digest.
+        """
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.hash_chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
     def _generate_remote_path(self, published_file):
         """
-        Works out the path for the file on the remote storage.
+        Works out the legacy flat path for the file on the remote storage.
         (This is not a required hook method)
         :param published_file:
         :return:
@@ -107,4 +687,4 @@ class LocalProvider(HookBaseClass):
         file_name = "{id}_{name}".format(
             id=published_file["id"], name=published_file["name"]
         )
-        return os.path.join(os.path.expandvars(self.remote_storage_location), file_name)
+        return os.path.join(self._get_root(), file_name)
@@ -12,13 +12,181 @@
 Hook that loads defines all the available actions, broken down by publish type.
 """
 
+import contextlib
+import errno
+import hashlib
+import json
 import os
+import tempfile
+import time
+
+import maya.cmds as cmds
 import sgtk
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
 
 class MayaActions(HookBaseClass):
+
+    # Maximum total size, in bytes, of the files downloaded from the remote storage
+    # kept on disk. Least recently used files are deleted when it is exceeded.
+    download_cache_budget = 50 * 1024 ** 3
+    # Seconds after which a lock on the download cache manifest is considered stale,
+    # left behind by a crashed session.
+    download_cache_lock_timeout = 30
+    # Maximum number of publishes downloaded at the same time by prefetch_publishes.
+    prefetch_max_workers = 8
+    # Actions needing the published files to be local, prefetched before running them.
+    prefetch_actions = ["reference", "import"]
+
+    def execute_multiple_actions(self, actions):
+        """
+        Executes the specified action on a list of items.
+
+        The published files needed by the actions are downloaded concurrently from
+        the remote storage before running the actions.
+
+        :param list actions: Action dictionaries, with a name, params and
+            sg_publish_data keys.
+        """
+        engine = self.parent.engine
+
+        def report_progress(completed, total, sg_publish_data):
+            message = "Downloaded %d of %d publishes from the remote storage." % (
+                completed,
+                total,
+            )
+            self.logger.info(message)
+            engine.show_busy("Downloading publishes", message)
+
+        try:
+            self.prefetch_publishes(
+                [
+                    action["sg_publish_data"]
+                    for action in actions
+                    if action["name"] in self.prefetch_actions
+                ],
+                progress_callback=report_progress,
+            )
+        finally:
+            engine.clear_busy()
+        try:
+            super(MayaActions, self).execute_multiple_actions(actions)
+        finally:
+            self._prefetched_ids = set()
+
+    def prefetch_publishes(self, sg_publish_data_list, progress_callback=None):
+        """
+        Downloads the given publishes from the remote storage if they are not
+        available locally, with a pool of :attr:`prefetch_max_workers` threads.
+
+        :param sg_publish_data_list: A list of Shotgun data dictionaries with all
+            the standard publish fields.
+        :param progress_callback: Optional callable called from the current thread
+            before the downloads start and each time a download is completed, with
+            the number of completed downloads, the number of downloads and the Shotgun
+            publish data dictionary, None before the downloads start.
+        :return: A dictionary where keys are PublishedFile ids and values the errors
+            for publishes which could not be downloaded.
+        """
+        missing = {}
+        paths = [
+            self.get_publish_path(sg_publish_data) for sg_publish_data in sg_publish_data_list
+        ]
+        existing = []
+        existing_paths = self._get_existing_paths(paths)
+        for path, sg_publish_data in zip(paths, sg_publish_data_list):
+            if path in existing_paths:
+                existing.append((sg_publish_data, path))
+            else:
+                missing[sg_publish_data["id"]] = (path, sg_publish_data)
+        self._touch_cached_downloads(existing)
+        # the actions run next don't need to update the manifest again
+        self._prefetched_ids = set(sg_publish_data["id"] for sg_publish_data, _ in existing)
+        if not missing:
+            return {}
+
+        remote_storage = self.load_framework("tk-framework-remotestorage_v1.x.x")
+        total = len(missing)
+        self.logger.info("Prefetching %d publishes from the remote storage." % total)
+        if progress_callback:
+            progress_callback(0, total, None)
+
+        def download(sg_publish_data):
+            # the file is hashed here so it is not read again from the main thread
+            downloaded_file = remote_storage.download_publish(sg_publish_data)
+            if downloaded_file and os.path.isfile(downloaded_file):
+                return downloaded_file, self._get_file_digest(downloaded_file)
+            return downloaded_file, None
+
+        to_download = list(missing.values())
+        completed = []
+
+        def on_completed(index, result, error):
+            completed.append(index)
+            if progress_callback:
+                progress_callback(len(completed), total, to_download[index][1])
+
+        transfer_utils = self.parent.create_hook_instance("{config}/common/transfer_utils.py")
+        results = [
+            (path, sg_publish_data, result, error)
+            for (path, sg_publish_data), (result, error) in zip(
+                to_download,
+                transfer_utils.run_in_parallel(
+                    download,
+                    [(sg_publish_data,) for _, sg_publish_data in to_download],
+                    self.prefetch_max_workers,
+                    callback=on_completed,
+                ),
+            )
+        ]
+
+        errors = {}
+        downloaded = []
+        for path, sg_publish_data, result, error in results:
+            downloaded_file, digest = result or (None, None)
+            if error is None and downloaded_file != path:
+                error = Exception(
+                    "The PublishedFile %s could not be downloaded to %s"
+                    % (sg_publish_data["id"], path)
+                )
+            if error is not None:
+                self.logger.warning(
+                    "Unable to prefetch PublishedFile %s: %s" % (sg_publish_data["id"], error)
+                )
+                errors[sg_publish_data["id"]] = error
+            else:
+                downloaded.append((sg_publish_data, path, digest))
+
+        # The manifest is only updated from the current thread.
+        self._add_cached_downloads(downloaded)
+        self._prefetched_ids.update(
+            sg_publish_data["id"] for sg_publish_data, _, _ in downloaded
+        )
+        return errors
+
+    def _get_existing_paths(self, paths):
+        """
+        Returns the given paths which exist locally, listing each folder once
+        instead of checking each path.
+
+        :param paths: A list of local paths.
+        :return: A set of the paths which exist.
+        """
+        folders = {}
+        for path in paths:
+            folders.setdefault(os.path.dirname(path), []).append(path)
+        existing_paths = set()
+        for folder, folder_paths in folders.items():
+            try:
+                file_names = set(os.listdir(folder))
+            except OSError:
+                continue
+            existing_paths.update(
+                path for path in folder_paths if os.path.basename(path) in file_names
+            )
+        return existing_paths
+
     def _create_reference(self, path, sg_publish_data):
         """
         Create a reference with the same settings Maya would use
@@ -55,6 +223,8 @@ class MayaActions(HookBaseClass):
         """
         if os.path.exists(path):
             # file already exists locally
+            if published_file["id"] not in getattr(self, "_prefetched_ids", ()):
+                self._touch_cached_downloads([(published_file, path)])
             return path
 
         remote_storage = self.load_framework("tk-framework-remotestorage_v1.x.x")
@@ -76,4 +246,185 @@ class MayaActions(HookBaseClass):
                 "The downloaded file path does not match the original "
                 "published one; original: %s downloaded: %s" % (path, downloaded_file)
             )
+        self._add_cached_download(published_file, downloaded_file)
         return downloaded_file
+
+    def _get_download_cache_manifest_path(self):
+        """
+        :return: Path to the file recording the files downloaded from the remote storage.
+        """
+        return os.path.join(self.parent.cache_location, "remote_storage_downloads.json")
+
+    def _load_download_cache(self):
+        """
+        Loads the manifest of the files downloaded from the remote storage.
+        :return: A dictionary where keys are PublishedFile ids, as strings, and values
+            dictionaries with the path, size, last access time and digest of the file.
+        """
+        try:
+            with open(self._get_download_cache_manifest_path(), "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save_download_cache(self, entries):
+        """
+        Saves the manifest of the files downloaded from the remote storage.
+        :param entries: A dictionary, as returned by :meth:`_load_download_cache`.
+        """
+        manifest_path = self._get_download_cache_manifest_path()
+        sgtk.util.filesystem.ensure_folder_exists(os.path.dirname(manifest_path))
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(manifest_path),
+            prefix=os.path.basename(manifest_path),
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            # replaced atomically, other sessions always read a complete manifest
+            os.replace(tmp_path, manifest_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextlib.contextmanager
+    def _lock_download_cache(self):
+        """
+        Context manager holding the lock of the download cache manifest, so several
+        Maya sessions sharing the cache location don't lose each other's updates
+        between loading and saving the manifest.
+
+        The lock is a file created exclusively next to the manifest. A lock older
+        than :attr:`download_cache_lock_timeout` is considered stale and removed.
+        """
+        lock_path = "%s.lock" % self._get_download_cache_manifest_path()
+        sgtk.util.filesystem.ensure_folder_exists(os.path.dirname(lock_path))
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                lock_age = time.time() - os.path.getmtime(lock_path)
+                if lock_age > self.download_cache_lock_timeout:
+                    self.logger.warning("Removing stale download cache lock %s" % lock_path)
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                # released in the meantime
+                continue
+            time.sleep(0.05)
+        try:
+            os.close(fd)
+            yield
+        finally:
+            os.remove(lock_path)
+
+    def _touch_cached_downloads(self, files):
+        """
+        Updates the last access time of the files downloaded from the remote
+        storage among the given files, with a single manifest update.
+        :param files: A list of PublishedFile entity dictionary, local path tuples.
+        """
+        if not files:
+            return
+        with self._lock_download_cache():
+            entries = self._load_download_cache()
+            touched = False
+            for published_file, path in files:
+                entry = entries.get(str(published_file["id"]))
+                if entry and entry["path"] == path:
+                    entry["last_access"] = time.time()
+                    touched = True
+            if touched:
+                self._save_download_cache(entries)
+
+    def _add_cached_download(self, published_file, path):
+        """
+        Records a file downloaded from the remote storage and deletes the least
+        recently used downloaded files if the download cache budget is exceeded.
+        :param published_file: A PublishedFile entity dictionary.
+        :param path: Path to the downloaded file.
+        """
+        self._add_cached_downloads([(published_file, path, self._get_file_digest(path))])
+
+    def _add_cached_downloads(self, downloads):
+        """
+        Records files downloaded from the remote storage and deletes the least
+        recently used downloaded files if the download cache budget is exceeded.
+        :param downloads: A list of PublishedFile entity dictionary, path, SHA-256
+            digest tuples. The digest can be None if it is not known.
+        """
+        if not downloads:
+            return
+        new_entries = {}
+        for published_file, path, digest in downloads:
+            new_entries[str(published_file["id"])] = {
+                "path": path,
+                "size": os.path.getsize(path),
+                "last_access": time.time(),
+                "digest": digest,
+            }
+
+        with self._lock_download_cache():
+            entries = self._load_download_cache()
+            entries.update(new_entries)
+            self._evict_cached_downloads(entries, keep=[path for _, path, _ in downloads])
+            self._save_download_cache(entries)
+
+    def _get_file_digest(self, path):
+        """
+        :param path: Path to a local file.
+        :return: The SHA-256 digest of the file, as an hexadecimal string.
+        """
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def _evict_cached_downloads(self, entries, keep=None):
+        """
+        Deletes the least recently used downloaded files until the download cache
+        fits in :attr:`download_cache_budget`.
+
+        Files referenced by the current Maya scene are never deleted. Other Maya
+        sessions sharing the cache location are not known: a file used by another
+        session can be deleted if it is among the least recently used ones.
+        :param entries: A dictionary, as returned by :meth:`_load_download_cache`,
+            updated in place.
+        :param keep: Optional list of paths which must not be deleted.
+        """
+        total = sum([entry["size"] for entry in entries.values()])
+        if total <= self.download_cache_budget:
+            return
+        pinned = set([os.path.normpath(p) for p in (keep or [])])
+        pinned.update([os.path.normpath(p) for p in self._get_scene_files()])
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.download_cache_budget:
+                break
+            if os.path.normpath(entry["path"]) in pinned:
+                continue
+            self.logger.debug("Evicting downloaded file %s" % entry["path"])
+            try:
+                os.remove(entry["path"])
+            except OSError as e:
+                if os.path.exists(entry["path"]):
+                    self.logger.warning("Unable to evict %s: %s" % (entry["path"], e))
+                    continue
+            del entries[key]
+            total -= entry["size"]
+
+    def _get_scene_files(self):
+        """
+        :return: A list of paths to the files used by the current Maya scene,
+            including references.
+        """
+        scene_files = cmds.file(query=True, list=True, withoutCopyNumber=True) or []
+        for ref_path in cmds.file(query=True, reference=True, withoutCopyNumber=True) or []:
+            scene_files.append(ref_path)
+        return scene_files
@@ -8,9 +8,23 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import copy
+import hashlib
+import json
+import os
 from pprint import pformat
+import tempfile
+import threading
+import time
+import uuid
+
 import sgtk
 
+try:
+    from tank_vendor import yaml
+except ImportError:
+    import yaml
+
 HookBaseClass = sgtk.get_hook_baseclass()
 
 
@@ -22,6 +36,20 @@ class PostPhase(HookBaseClass):
     See the PublishTree documentation for additional details on how to traverse the tree and manipulate it.
     """
 
+    # Maximum number of published files uploaded to the remote storage at the same time.
+    _upload_max_workers = 8
+    # Number of times a failed upload is retried before giving up.
+    _upload_max_retries = 2
+    # Upload published files in a background thread so the publisher UI is not blocked.
+    _upload_in_background = True
+    _monitor_status_lock = threading.Lock()
+    # Statuses reported to the monitor status log by the background publish process,
+    # once the items and their tasks are published, then finalized.
+    _monitor_published_status = "published"
+    _monitor_finalized_status = "finalized"
+    # Maximum number of thumbnails encoded and written at the same time.
+    _thumbnail_max_workers = 4
+
     def post_publish(self, publish_tree):
         """
         This method is executed after the publish pass has completed for each
@@ -61,61 +89,16 @@ class PostPhase(HookBaseClass):
         bg_processing = publish_tree.root_item.properties.get("bg_processing")
         in_bg_process = publish_tree.root_item.properties.get("in_bg_process")
 
+        # in the background publishing process, let the monitor know the items are published
+        if in_bg_process:
+            self._report_tree_status(publish_tree, self._monitor_published_status)
+            return
+
         # we only want to run the actions if we're going to publish in background but we're not already in the
         # background publishing process
-        if not bg_processing or in_bg_process:
+        if not bg_processing:
             return
 
-        # modify the publish tree in order to add a new property/setting on the fly in order to give
-        # the item/task a unique identifier
-        # this will be very useful to track the tasks progress on the monitor side
-        # we can't rely on names here as some items/tasks can have the same name
-        # at the same time, start to build the monitor tree
-        for item in publish_tree:
-
-            # if the item has a thumbnail, download it and make sure we can access it later in the bg process
-            thumbnail_path = item.get_thumbnail_as_path()
-            if thumbnail_path:
-                item._thumbnail_path = thumbnail_path
-
-            item_uuid = str(uuid.uuid4())
-            item_data = {
-                "name": item.name,
-                "uuid": item_uuid,
-                "status": bg_publish_app.constants.WAITING_TO_START,
-                "tasks": [],
-                "is_parent_root": item.parent.is_root,
-            }
-
-            for task in item.tasks:
-                if task.active:
-
-                    # as we can't create a PublishSetting object using the Publish API, convert the task to a dict then
-                    # add the new setting to finally reset the task from the dict
-                    uuid_setting = {
-                        "name": "Task UUID",
-                        "type": "str",
-                        "default_value": None,
-                        "description": "UUID of the current task",
-                        "value": str(uuid.uuid4()),
-                    }
-                    dummy_task_dict = task.to_dict()
-                    dummy_task_dict["settings"]["Task UUID"] = uuid_setting
-                    dummy_task = task.from_dict(dummy_task_dict, None)
-                    task.settings["Task UUID"] = dummy_task.settings["Task UUID"]
-
-                    item_data["tasks"].append(
-                        {
-                            "name": task.name,
-                            "uuid": uuid_setting["value"],
-                            "status": bg_publish_app.constants.WAITING_TO_START,
-                        }
-                    )
-
-            if item_data["tasks"]:
-                item.properties.uuid = item_uuid
-                monitor_data["items"].append(item_data)
-
         # get the path to the folder where all the files used by the background publishing process will be stored
         root_folder_path = os.path.join(
             bg_publish_app.cache_location, current_engine.name
@@ -124,13 +107,23 @@ class PostPhase(HookBaseClass):
             os.makedirs(root_folder_path)
         tmp_folder_path = tempfile.mkdtemp(dir=root_folder_path)
 
-        # build the path to these files
-        self.__TREE_FILE_PATH = os.path.join(tmp_folder_path, "publish_tree.yml")
-        monitor_file_path = os.path.join(tmp_folder_path, "monitor.yml")
+        # if the items have a thumbnail, write it to disk and make sure we can access it later in the bg process
+        self._export_thumbnails(publish_tree, tmp_folder_path)
+
+        monitor_data["items"] = self._tag_publish_tree(
+            publish_tree, bg_publish_app.constants.WAITING_TO_START
+        )
+
+        # create the append-only log where the task status changes are reported, its path
+        # is saved with the tree so the background process can find it
+        monitor_status_path = os.path.join(tmp_folder_path, "monitor_status.log")
+        open(monitor_status_path, "a").close()
+        publish_tree.root_item.properties["monitor_status_path"] = monitor_status_path
 
         # finally, save the publish tree and the monitor data to the files
+        self.__TREE_FILE_PATH = os.path.join(tmp_folder_path, "publish_tree.yml")
         publish_tree.save_file(self.__TREE_FILE_PATH)
-        with open(monitor_file_path, "w+") as fp:
+        with open(os.path.join(tmp_folder_path, "monitor.yml"), "w+") as fp:
             yaml.safe_dump(monitor_data, fp)
 
         self.logger.info(
@@ -180,30 +173,500 @@ class PostPhase(HookBaseClass):
             bg_publish_app.launch_publish_process(self.__TREE_FILE_PATH)
             bg_publish_app.create_panel()
 
+        if in_bg_process:
+            self._report_tree_status(publish_tree, self._monitor_finalized_status)
+
 
 
         remote_storage = self.load_framework("tk-framework-remotestorage_v1.x.x")
 
-        # loop over all items and try and extract out the sg_publish_data if we can.
-        # TODO: check that publishes with the same path have same id
+        published_files = self.collect_published_files(publish_tree)
+        self.logger.info(
+            "Uploading %d published files to the remote storage." % len(published_files)
+        )
+        self.upload_publishes(remote_storage, published_files)
+
+    def collect_published_files(self, publish_tree):
+        """
+        Collect the published file data of the publish tree items, in a single
+        walk over the tree since iterating over it already visits all the
+        descendants.
+
+        Published files sharing the same local path but with different ids are
+        reported as warnings.
+
+        :param publish_tree: The :ref:`publish-api-tree` instance.
+        :returns: A list of PublishedFile entity dictionaries, without duplicates.
+        """
         published_files = {}
+        ids_by_path = {}
         for item in publish_tree:
             p_data = self.get_published_file_data(item)
-            self.logger.info("p_data %s" % p_data)
-            if p_data:
-                published_files[p_data["id"]] = p_data
-            for child_item in item.descendants:
-                c_p_data = self.get_published_file_data(child_item)
-                self.logger.info("c_p_data %s" % c_p_data)
-                if c_p_data:
-                    published_files[c_p_data["id"]] = c_p_data
+            self.logger.debug("p_data %s" % p_data)
+            if not p_data:
+                continue
+            published_files[p_data["id"]] = p_data
+            local_path = (p_data.get("path") or {}).get("local_path")
+            if local_path:
+                ids_by_path.setdefault(local_path, set()).add(p_data["id"])
+
+        for local_path, ids in ids_by_path.items():
+            if len(ids) > 1:
+                self.logger.warning(
+                    "PublishedFiles %s share the same path: %s"
+                    % (", ".join(str(i) for i in sorted(ids)), local_path)
+                )
+        self.logger.debug(
+            "Collected the following published files: %s" % pformat(published_files)
+        )
+        return list(published_files.values())
+
+    def _export_thumbnails(self, publish_tree, folder_path):
+        """
+        Write the thumbnails of the publish tree items to the given folder and
+        make the items use these files.
+
+        Thumbnails are encoded and written by a pool of :attr:`_thumbnail_max_workers`
+        threads. Items sharing the same thumbnail, like the session thumbnail, are only
+        encoded once and thumbnails with the same content are only written once.
+
+        :param publish_tree: The :ref:`publish-api-tree` instance.
+        :param str folder_path: Path to the folder to write the thumbnails to.
+        """
+        try:
+            from sgtk.platform.qt import QtCore
+        except ImportError:
+            QtCore = None
+
+        images = {}
+        items_by_image = {}
+        for item in publish_tree:
+            if getattr(item, "_thumbnail_path", None):
+                continue
+            if QtCore is None:
+                thumbnail_path = item.get_thumbnail_as_path()
+                if thumbnail_path:
+                    item._thumbnail_path = thumbnail_path
+                continue
+            pixmap = item.thumbnail
+            if not pixmap or pixmap.isNull():
+                continue
+            # pixmaps can only be used from the main thread, convert them to images
+            # which can be encoded by the worker threads
+            key = pixmap.cacheKey()
+            if key not in images:
+                images[key] = pixmap.toImage()
+            items_by_image.setdefault(key, []).append(item)
+        if not images:
+            return
+
+        thumbnails_folder = os.path.join(folder_path, "thumbnails")
+        if not os.path.exists(thumbnails_folder):
+            os.makedirs(thumbnails_folder)
+        written = set()
+        written_lock = threading.Lock()
+
+        def export(image):
+            byte_array = QtCore.QByteArray()
+            buffer = QtCore.QBuffer(byte_array)
+            buffer.open(QtCore.QIODevice.WriteOnly)
+            image.save(buffer, "PNG")
+            buffer.close()
+            data = byte_array.data()
+            path = os.path.join(thumbnails_folder, "%s.png" % hashlib.sha1(data).hexdigest())
+            with written_lock:
+                if path in written:
+                    return path
+                written.add(path)
+            with open(path, "wb") as fp:
+                fp.write(data)
+            return path
+
+        keys = list(images.keys())
+        results = self._get_transfer_utils().run_in_parallel(
+            export, [(images[key],) for key in keys], self._thumbnail_max_workers
+        )
+        for key, (path, error) in zip(keys, results):
+            if error is not None:
+                self.logger.warning("Unable to export a thumbnail: %s" % error)
+                continue
+            for item in items_by_image[key]:
+                item._thumbnail_path = path
+        self.logger.debug(
+            "Exported %d thumbnails for %d items to %s."
+            % (len(written), sum(len(items) for items in items_by_image.values()), thumbnails_folder)
+        )
+
+    def _tag_publish_tree(self, publish_tree, status):
+        """
+        Give each item and active task of the publish tree a unique identifier and
+        build the monitor items, in a single walk over the tree.
+
+        :param publish_tree: The :ref:`publish-api-tree` instance to tag.
+        :param status: Initial status of the monitored items and tasks.
+        :returns: A list of monitor item dictionaries.
+        """
+        monitor_items = []
+
+        # modify the publish tree in order to add a new property/setting on the fly in order to give
+        # the item/task a unique identifier
+        # this will be very useful to track the tasks progress on the monitor side
+        # we can't rely on names here as some items/tasks can have the same name
+        # at the same time, start to build the monitor tree
+        for item in publish_tree:
+            item_uuid = str(uuid.uuid4())
+            item_data = {
+                "name": item.name,
+                "uuid": item_uuid,
+                "status": status,
+                "tasks": [],
+                "is_parent_root": item.parent.is_root,
+            }
+
+            for task in item.tasks:
+                if task.active:
+                    task_uuid = str(uuid.uuid4())
+                    self._attach_task_setting(
+                        task, "Task UUID", task_uuid, "UUID of the current task"
+                    )
+                    item_data["tasks"].append(
+                        {"name": task.name, "uuid": task_uuid, "status": status}
+                    )
+
+            if item_data["tasks"]:
+                item.properties.uuid = item_uuid
+                monitor_items.append(item_data)
+
+        return monitor_items
+
+    def _attach_task_setting(self, task, name, value, description):
+        """
+        Add a string setting to a task.
+
+        As we can't create a PublishSetting object using the Publish API, the first
+        setting with a given name is created by converting a task to a dict, adding
+        the setting and resetting a task from the dict. This setting is then copied
+        for all the other tasks, instead of rebuilding each task and its settings.
+
+        :param task: The task to add the setting to.
+        :param str name: Name of the setting.
+        :param str value: Value of the setting.
+        :param str description: Description of the setting.
+        """
+        templates = getattr(self, "_task_setting_templates", None)
+        if templates is None:
+            templates = self._task_setting_templates = {}
+        if name not in templates:
+            task_dict = task.to_dict()
+            task_dict["settings"][name] = {
+                "name": name,
+                "type": "str",
+                "default_value": None,
+                "description": description,
+                "value": value,
+            }
+            templates[name] = task.from_dict(task_dict, None).settings[name]
+        setting = copy.copy(templates[name])
+        setting.value = value
+        task.settings[name] = setting
+
+    def report_monitor_status(self, monitor_status_path, item_uuid, status):
+        """
+        Report the new status of a monitored item or task by appending a line to
+        the monitor status log, instead of rewriting the whole monitor data.
+
+        :param str monitor_status_path: Path to the monitor status log, stored in
+            the ``monitor_status_path`` property of the publish tree root item.
+        :param str item_uuid: UUID of the item or task assigned by :meth:`post_publish`.
+        :param status: The new status.
+        """
+        self.report_monitor_statuses(monitor_status_path, [(item_uuid, status)])
+
+    def report_monitor_statuses(self, monitor_status_path, statuses):
+        """
+        Report the new statuses of several monitored items or tasks, with a single
+        write to the monitor status log.
+
+        :param str monitor_status_path: Path to the monitor status log.
+        :param statuses: A list of (item or task UUID, status) tuples.
+        """
+        now = time.time()
+        lines = "".join(
+            "%s\n" % json.dumps({"uuid": item_uuid, "status": status, "time": now})
+            for item_uuid, status in statuses
+        )
+        with self._monitor_status_lock:
+            with open(monitor_status_path, "a") as fp:
+                fp.write(lines)
+
+    def _report_tree_status(self, publish_tree, status):
+        """
+        Report a status for all the items and active tasks tagged by
+        :meth:`_tag_publish_tree`, from the background publishing process.
+
+        :param publish_tree: The :ref:`publish-api-tree` instance loaded by the
+            background publishing process.
+        :param status: The status to report.
+        """
+        monitor_status_path = publish_tree.root_item.properties.get("monitor_status_path")
+        if not monitor_status_path:
+            return
+
+        statuses = []
+        for item in publish_tree:
+            item_uuid = item.properties.get("uuid")
+            if not item_uuid:
+                continue
+            for task in item.tasks:
+                if task.active and "Task UUID" in task.settings:
+                    statuses.append((task.settings["Task UUID"].value, status))
+            statuses.append((item_uuid, status))
+        if statuses:
+            self.report_monitor_statuses(monitor_status_path, statuses)
+
+    def read_monitor_statuses(self, monitor_status_path, offset=0):
+        """
+        Read the status changes appended to the monitor status log since the
+        given offset, so the monitor only processes new updates.
+
+        :param str monitor_status_path: Path to the monitor status log.
+        :param int offset: Offset returned by the previous call, 0 to read all
+            the status changes.
+        :returns: A tuple with a dictionary where keys are item and task UUIDs and
+            values their latest status, and the offset to use for the next call.
+        """
+        try:
+            with open(monitor_status_path, "rb") as fp:
+                fp.seek(offset)
+                data = fp.read()
+        except (IOError, OSError):
+            return {}, offset
+        # the last line could still be being written
+        end = data.rfind(b"\n") + 1
+        statuses = {}
+        for line in data[:end].splitlines():
+            try:
+                update = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            statuses[update["uuid"]] = update["status"]
+        return statuses, offset + end
+
+    def upload_publishes(self, remote_storage, published_files):
+        """
+        Upload the given published files to the remote storage.
+
+        Published files sharing the same local path are transferred once: the
+        first one is uploaded with the others, the remaining ones are uploaded
+        once it is stored, so the storage only records their id against the
+        content already stored.
+
+        Uploads are run by a pool of :attr:`_upload_max_workers` threads, in a
+        background thread if :attr:`_upload_in_background` is set. The results
+        are reported from the main thread in both cases.
+
+        :param remote_storage: The remote storage framework instance.
+        :param published_files: A list of PublishedFile entity dictionaries.
+        :returns: The background ``Thread`` running the uploads, or ``None`` if
+            they were run in the current thread.
+        """
+        to_upload = []
+        duplicates = []
+        by_path = {}
+        for published_file in published_files:
+            local_path = (published_file.get("path") or {}).get("local_path")
+            if local_path and local_path in by_path:
+                duplicates.append((published_file, by_path[local_path]))
+                continue
+            if local_path:
+                by_path[local_path] = published_file
+            to_upload.append(published_file)
+
+        if not self._upload_in_background:
+            start = time.time()
+            results = self._run_uploads(remote_storage, to_upload, duplicates)
+            self._report_uploads(results, time.time() - start)
+            return None
+
+        def run():
+            start = time.time()
+            results = self._run_uploads(remote_storage, to_upload, duplicates)
+            self._execute_in_main_thread(self._report_uploads, results, time.time() - start)
+
+        thread = threading.Thread(target=run, name="RemoteStorageUpload")
+        thread.start()
+        return thread
+
+    def _run_uploads(self, remote_storage, published_files, duplicates):
+        """
+        Upload the given published files with a pool of threads, then the
+        published files sharing their local path.
+
+        Nothing is logged from here: this can run in a background thread, the
+        progress is reported from the main thread with :meth:`_report_upload_progress`
+        and the results are returned to be reported with :meth:`_report_uploads`.
+
+        :param remote_storage: The remote storage framework instance.
+        :param published_files: A list of PublishedFile entity dictionaries.
+        :param duplicates: A list of (PublishedFile, uploaded PublishedFile) tuples
+            for the published files sharing the local path of an uploaded one.
+        :returns: A list of (PublishedFile, error, attempts) tuples, the error is
+            ``None`` for successful uploads.
+        """
+        total = len(published_files) + len(duplicates)
+        progress = {"done": 0}
+
+        def on_completed(published_file, result):
+            progress["done"] += 1
+            self._execute_in_main_thread(
+                self._report_upload_progress,
+                progress["done"],
+                total,
+                published_file.get("name"),
+                result[0] if result else None,
+            )
+
+        transfer_utils = self._get_transfer_utils()
+        results = transfer_utils.run_in_parallel(
+            self._upload_with_retries,
+            [(remote_storage, published_file) for published_file in published_files],
+            self._upload_max_workers,
+            callback=lambda index, result, _: on_completed(published_files[index], result),
+        )
+        uploaded = [
+            (published_file, error, attempts)
+            for published_file, ((error, attempts), _) in zip(published_files, results)
+        ]
+
+        errors = dict(
+            (published_file["id"], error) for published_file, error, _ in uploaded
+        )
+        to_register = []
+        for published_file, first in duplicates:
+            if errors.get(first["id"]):
+                # don't transfer again the content which just failed to upload
+                uploaded.append((published_file, errors[first["id"]], 0))
+                on_completed(published_file, (errors[first["id"]], 0))
+            else:
+                to_register.append(published_file)
+
+        results = transfer_utils.run_in_parallel(
+            self._upload_with_retries,
+            [(remote_storage, published_file) for published_file in to_register],
+            self._upload_max_workers,
+            callback=lambda index, result, _: on_completed(to_register[index], result),
+        )
+        uploaded.extend(
+            (published_file, error, attempts)
+            for published_file, ((error, attempts), _) in zip(to_register, results)
+        )
+        return uploaded
+
+    def _execute_in_main_thread(self, func, *args):
+        """
+        Call a function from the main thread, the logger and the publisher UI can't
+        be used from other threads.
+
+        :param func: The function to call.
+        :param args: The function arguments.
+        """
+        if threading.current_thread() is threading.main_thread():
+            func(*args)
+        else:
+            sgtk.platform.current_engine().async_execute_in_main_thread(func, *args)
 
+    def _report_upload_progress(self, done, total, name, error):
+        """
+        Log the progress of the uploads. Must be called from the main thread.
+
+        :param int done: Number of published files processed.
+        :param int total: Number of published files to upload.
+        :param str name: Name of the published file just processed.
+        :param error: The upload error, ``None`` if it succeeded.
+        """
+        self.logger.info(
+            "Upload %d/%d %s: %s" % (done, total, "failed" if error else "done", name)
+        )
+
+    def _report_uploads(self, results, duration):
+        """
+        Log a summary of the uploads and show the failures to the user.
+
+        Must be called from the main thread.
+
+        :param results: The list of (PublishedFile, error, attempts) tuples returned
+            by :meth:`_run_uploads`.
+        :param float duration: The duration of the uploads in seconds.
+        """
+        failures = [result for result in results if result[1]]
         self.logger.info(
-            "Uploading the following published files: %s" % pformat(published_files)
+            "Remote storage upload finished in %.1fs: %d succeeded, %d failed."
+            % (duration, len(results) - len(failures), len(failures))
         )
-        remote_storage.upload_publishes(list(published_files.values()))
+        if not failures:
+            return
 
+        details = "\n".join(
+            "PublishedFile %s (%s), %d attempts: %s"
+            % (published_file["id"], published_file.get("name"), attempts, error)
+            for published_file, error, attempts in failures
+        )
+        self.logger.error(
+            "%d published files failed to upload to the remote storage." % len(failures),
+            extra={
+                "action_show_more_info": {
+                    "label": "Show Errors",
+                    "tooltip": "Show the upload errors",
+                    "text": details,
+                }
+            },
+        )
 
+        # the publish was already reported as successful, let the user know
+        engine = sgtk.platform.current_engine()
+        if engine and engine.has_ui:
+            from sgtk.platform.qt import QtGui
+
+            message_box = QtGui.QMessageBox(
+                QtGui.QMessageBox.Warning,
+                "Remote Storage Upload",
+                "%d published files could not be uploaded to the remote storage, "
+                "they are published but only available locally." % len(failures),
+            )
+            message_box.setDetailedText(details)
+            message_box.exec_()
+
+    def _upload_with_retries(self, remote_storage, published_file):
+        """
+        Upload a published file to the remote storage, retrying up to
+        :attr:`_upload_max_retries` times if it fails.
+
+        :param remote_storage: The remote storage framework instance.
+        :param published_file: A PublishedFile entity dictionary.
+        :returns: A (error, attempts) tuple, the error is ``None`` if the upload
+            succeeded, the last error otherwise.
+        """
+        error = None
+        for attempt in range(self._upload_max_retries + 1):
+            try:
+                if hasattr(remote_storage, "upload_publish"):
+                    remote_storage.upload_publish(published_file)
+                else:
+                    remote_storage.upload_publishes([published_file])
+                return None, attempt + 1
+            except Exception as e:
+                error = e
+        return error, self._upload_max_retries + 1
+
+    def _get_transfer_utils(self):
+        """
+        Get the hook shared by the config hooks to run transfers in parallel.
+        """
+        if getattr(self, "_transfer_utils", None) is None:
+            self._transfer_utils = self.parent.create_hook_instance(
+                "{config}/common/transfer_utils.py"
+            )
+        return self._transfer_utils
 
     def get_published_file_data(self, item):
         if hasattr(item.properties, "sg_publish_data"):
@@ -8,8 +8,10 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import errno
 import os
 import pprint
+import sys
 import traceback
 
 import sgtk
@@ -20,6 +22,14 @@ HookBaseClass = sgtk.get_hook_baseclass()
 
 class BasicFilePublishPlugin(HookBaseClass):
 
+    # Maximum number of files copied at the same time when publishing a sequence.
+    copy_max_workers = 8
+    # Hard link the published files to the source files if they are on the same file
+    # system, instead of copying them. Linked files share their content and permissions:
+    # only enable this if source files are never overwritten in place, or an already
+    # published version would silently change.
+    allow_hardlinks = False
+
     @property
     def settings(self):
         """
@@ -60,11 +70,10 @@ class BasicFilePublishPlugin(HookBaseClass):
     def _copy_work_to_publish(self, settings, item):
         """
         Copies the source file to the publish location.
-        Handling of sequence paths is not implemented, see
-        the base hook for an example on how to go about doing that.
+        Image sequences are copied frame by frame, in parallel, skipping the
+        frames which were already copied.
         """
 
-        # TODO: rework this to handle sequences.
         source_path = item.properties.path
         publish_path = self.get_publish_path(settings, item)
 
@@ -76,11 +85,12 @@ class BasicFilePublishPlugin(HookBaseClass):
             )
             return
 
-        # copy the file
+        # copy the files
         try:
-            publish_folder = os.path.dirname(publish_path)
-            ensure_folder_exists(publish_folder)
-            copy_file(source_path, publish_path)
+            copies = self._get_files_to_copy(
+                source_path, publish_path, item.properties.get("sequence_paths")
+            )
+            copied = self._copy_files(copies)
         except Exception:
             raise Exception(
                 "Failed to copy source file from '%s' to '%s'.\n%s"
@@ -88,9 +98,113 @@ class BasicFilePublishPlugin(HookBaseClass):
             )
 
         self.logger.debug(
-            "Copied source file '%s' to publish file '%s'."
-            % (source_path, publish_path)
+            "Copied source file '%s' to publish file '%s' (%d of %d files copied)."
+            % (source_path, publish_path, copied, len(copies))
+        )
+
+    def _get_files_to_copy(self, source_path, publish_path, sequence_paths=None):
+        """
+        Get the files to copy to publish the given source path.
+
+        Like the base publish hook, the item is only handled as an image sequence
+        if the collector set its ``sequence_paths`` property, the file name is not
+        enough to tell. Each frame of the source sequence is then copied to the
+        matching frame of the publish path, e.g. ``/path/render.%04d.exr``.
+
+        :param source_path: The path of the source file or sequence.
+        :param publish_path: The path of the publish file or sequence.
+        :param sequence_paths: The source frame paths, if the item is an image
+            sequence.
+
+        :return: A list of (source, destination) path tuples.
+        """
+        if not sequence_paths:
+            return [(source_path, publish_path)]
+
+        transfer_utils = self._get_transfer_utils()
+        if not transfer_utils.is_sequence_path(publish_path):
+            raise Exception(
+                "The publish path '%s' of the sequence '%s' has no frame number token."
+                % (publish_path, source_path)
+            )
+        copies = [
+            (frame_path, transfer_utils.get_frame_path(publish_path, frame))
+            for frame, frame_path in transfer_utils.expand_sequence(source_path, sequence_paths)
+        ]
+        if not copies:
+            raise Exception("No frames found for the sequence '%s'." % source_path)
+        return copies
+
+    def _copy_files(self, copies):
+        """
+        Copies the given files with a pool of :attr:`copy_max_workers` threads.
+
+        :param copies: A list of (source, destination) path tuples.
+
+        :return: The number of files copied or linked, files already up to date
+            being skipped.
+        """
+        for publish_folder in set(os.path.dirname(destination) for _, destination in copies):
+            ensure_folder_exists(publish_folder)
+
+        results = self._get_transfer_utils().run_in_parallel(
+            self._copy_frame, copies, self.copy_max_workers
         )
+        for (source, destination), (_, error) in zip(copies, results):
+            if error is not None:
+                raise Exception(
+                    "Failed to copy '%s' to '%s': %s" % (source, destination, error)
+                )
+        return sum(copied for copied, _ in results)
+
+    def _get_transfer_utils(self):
+        """
+        Get the hook shared by the config hooks to handle image sequences and run
+        transfers in parallel.
+        """
+        if getattr(self, "_transfer_utils", None) is None:
+            self._transfer_utils = self.parent.create_hook_instance(
+                "{config}/common/transfer_utils.py"
+            )
+        return self._transfer_utils
+
+    def _copy_frame(self, source, destination):
+        """
+        Copies a file, unless the destination already has the same size and
+        modification time. The file is hard linked instead if :attr:`allow_hardlinks`
+        is enabled and both paths are on the same file system.
+
+        :param source: The path of the file to copy.
+        :param destination: The path to copy the file to.
+
+        :return: True if the file was copied or linked, False if it was skipped.
+        """
+        source_stat = os.stat(source)
+        try:
+            destination_stat = os.stat(destination)
+        except OSError:
+            destination_stat = None
+        if destination_stat is not None:
+            if os.path.samestat(source_stat, destination_stat) or (
+                source_stat.st_size == destination_stat.st_size
+                and int(source_stat.st_mtime) == int(destination_stat.st_mtime)
+            ):
+                return False
+            os.remove(destination)
+
+        if self.allow_hardlinks and hasattr(os, "link"):
+            if source_stat.st_dev == os.stat(os.path.dirname(destination)).st_dev:
+                try:
+                    os.link(source, destination)
+                    return True
+                except OSError as e:
+                    if e.errno == errno.EEXIST:
+                        raise
+
+        copy_file(source, destination)
+        # keep the modification time so the copy can be skipped next time
+        os.utime(destination, (source_stat.st_atime, source_stat.st_mtime))
+        return True
 
     def get_publish_template(self, settings, item):
         """
@@ -115,9 +229,221 @@ class BasicFilePublishPlugin(HookBaseClass):
         # determine the publish type
         extension = path_info["extension"]
 
-        for template_config in publish_templates.value:
-            if extension in template_config["ext"] and entity_type == template_config["entity_type"]:
-                return self.sgtk.templates[template_config["template"]]
+        template_name = self._get_publish_template_index(publish_templates.value).get(
+            (entity_type, extension)
+        )
+        if template_name:
+            return self.sgtk.templates[template_name]
+
+    def _get_publish_template_index(self, publish_templates):
+        """
+        Get a dictionary mapping (entity_type, extension) to the template name of
+        the first matching Publish Template rule.
+
+        The dictionary is built once for this hook instance: the Publish Template
+        setting is defined for the plugin in the environment configuration, the
+        settings of each task are copies of it which can't be edited.
+
+        :param publish_templates: The Publish Template setting value.
+
+        :return: A dictionary where keys are (entity_type, extension) tuples and
+            values template names.
+        """
+        index = getattr(self, "_publish_template_index", None)
+        if index is None:
+            index = self._publish_template_index = self._build_publish_template_index(
+                publish_templates
+            )
+        return index
+
+    def _build_publish_template_index(self, publish_templates):
+        """
+        Build the (entity_type, extension) to template name dictionary for the
+        given Publish Template rules. Rules are evaluated in order so the first
+        matching rule wins, rules overlapping or shadowed by a previous rule are
+        reported as warnings.
+
+        :param publish_templates: The Publish Template setting value.
+
+        :return: A dictionary where keys are (entity_type, extension) tuples and
+            values template names.
+        """
+        index = {}
+        for position, template_config in enumerate(publish_templates):
+            extensions = template_config["ext"]
+            if isinstance(extensions, str):
+                extensions = [extensions]
+            shadowed = []
+            for extension in extensions:
+                key = (template_config["entity_type"], extension)
+                if key in index:
+                    shadowed.append((extension, index[key]))
+                    continue
+                index[key] = (position, template_config["template"])
+
+            if shadowed and len(shadowed) == len(extensions):
+                self.logger.warning(
+                    "Publish Template rule %d (%s) is shadowed by previous rules and will never be used."
+                    % (position, template_config["template"])
+                )
+            for extension, (previous_position, previous_template) in shadowed:
+                self.logger.warning(
+                    "Publish Template rule %d (%s) overlaps rule %d (%s) for %s files of %s entities, "
+                    "rule %d is used."
+                    % (
+                        position,
+                        template_config["template"],
+                        previous_position,
+                        previous_template,
+                        extension,
+                        template_config["entity_type"],
+                        previous_position,
+                    )
+                )
+        return dict((key, template) for key, (_, template) in index.items())
+
+    def _template_from_path(self, path):
+        """
+        Find the template matching the given path, like ``sgtk.template_from_path``,
+        but only validating the templates whose leading folders match the path.
+
+        :param path: The path to find a template for.
+
+        :return: The matching template or None.
+        """
+        return self._match_template(path, self._get_template_candidates(path))
+
+    def _templates_from_paths(self, paths):
+        """
+        Find the templates matching the given paths. The candidate templates are
+        only looked up once for all the paths in the same folder.
+
+        :param paths: A list of paths to find a template for.
+
+        :return: A dictionary where keys are paths and values the matching template
+            or None.
+        """
+        candidates_by_folder = {}
+        templates = {}
+        for path in paths:
+            folder = os.path.dirname(path)
+            if folder not in candidates_by_folder:
+                candidates_by_folder[folder] = self._get_template_candidates(
+                    folder, any_file_name=True
+                )
+            templates[path] = self._match_template(path, candidates_by_folder[folder])
+        return templates
+
+    def _match_template(self, path, candidates):
+        """
+        Find the template matching the given path among the candidate templates.
+
+        :param path: The path to find a template for.
+        :param candidates: A list of candidate templates.
+
+        :return: The matching template or None.
+        """
+        matches = [template for template in candidates if template.validate(path)]
+        if len(matches) > 1:
+            # let Toolkit report the ambiguous templates
+            return self.sgtk.template_from_path(path)
+        return matches[0] if matches else None
+
+    def _get_template_candidates(self, path, any_file_name=False):
+        """
+        Get the templates which can match the given path from the template path trie.
+
+        :param path: The path to get the candidate templates for.
+        :param any_file_name: If True, get the templates which can match any file in
+            the given folder path.
+
+        :return: A list of templates.
+        """
+        trie, unindexed = self._get_template_trie()
+        candidates = list(unindexed)
+        nodes = [trie]
+        for segment in self._split_template_path(path):
+            next_nodes = []
+            for children, _ in nodes:
+                for key in (segment, "*"):
+                    if key in children:
+                        next_nodes.append(children[key])
+                        candidates.extend(children[key][1])
+            if not next_nodes:
+                return candidates
+            nodes = next_nodes
+        if any_file_name:
+            for children, _ in nodes:
+                for child in children.values():
+                    candidates.extend(child[1])
+        return candidates
+
+    def _get_template_trie(self):
+        """
+        Get the template path trie, built once for the current templates.
+
+        Templates are indexed by their leading folders, folders made of a single key
+        like ``{Shot}`` being indexed as a ``*`` wildcard matching any folder since key
+        values can't contain path separators. Indexing stops at the first folder
+        mixing static text and keys, or containing an optional section.
+
+        Each trie node is a (children, templates) tuple, where children maps a folder
+        to a child node and templates lists the templates whose indexed folders end
+        at this node. Templates which can't be indexed are returned separately, they
+        are candidates for any path.
+
+        :return: A (trie, unindexed templates) tuple.
+        """
+        templates = self.sgtk.templates
+        cached = getattr(self, "_template_trie", None)
+        if cached and cached[0] is templates:
+            return cached[1]
+
+        trie = ({}, [])
+        unindexed = []
+        for template in templates.values():
+            root_path = getattr(template, "root_path", None)
+            if root_path is None:
+                unindexed.append(template)
+                continue
+            segments = self._split_template_path(
+                os.path.join(root_path, template.definition)
+            )
+            node = trie
+            depth = 0
+            for segment in segments:
+                if "[" in segment:
+                    break
+                if "{" in segment:
+                    if not (
+                        segment.startswith("{")
+                        and segment.endswith("}")
+                        and segment.count("{") == 1
+                    ):
+                        break
+                    segment = "*"
+                node = node[0].setdefault(segment, ({}, []))
+                depth += 1
+            if depth:
+                node[1].append(template)
+            else:
+                unindexed.append(template)
+
+        self._template_trie = (templates, (trie, unindexed))
+        return trie, unindexed
+
+    def _split_template_path(self, path):
+        """
+        Split a path into its folders, in a case insensitive way on Windows.
+
+        :param path: The path to split.
+
+        :return: A list of path segments.
+        """
+        path = path.replace("\\", "/")
+        if sys.platform == "win32":
+            path = path.lower()
+        return [segment for segment in path.split("/") if segment]
 
     def get_publish_path(self, settings, item):
         """
@@ -130,14 +456,136 @@ class BasicFilePublishPlugin(HookBaseClass):
             registering a publish for the supplied item
 
         Extracts the publish path via the configured work and publish templates
-        if possible.
+        if possible. The first time an item is seen, the publish paths of all the
+        items this plugin publishes are resolved together with
+        :meth:`get_publish_paths` and cached for the next calls.
         """
-
-        # publish type explicitly set or defined on the item
         publish_path = item.get_property("publish_path")
         if publish_path:
             return publish_path
 
+        cache = getattr(self, "_publish_path_cache", None)
+        if cache is None:
+            cache = self._publish_path_cache = {}
+
+        def is_cached(other_item):
+            cached = cache.get(id(other_item))
+            return (
+                cached is not None
+                and cached[0] is other_item
+                and cached[1] == other_item.properties.path
+                and cached[2] == other_item.context
+            )
+
+        if is_cached(item):
+            return cache[id(item)][3]
+
+        # the path, the context and the publish path property can change until the
+        # item is published, only resolve the items not already cached
+        items = [
+            other_item
+            for other_item in self._get_plugin_items(settings, item)
+            if other_item is item or not is_cached(other_item)
+        ]
+        for other_item, publish_path in zip(items, self.get_publish_paths(settings, items)):
+            cache[id(other_item)] = (
+                other_item,
+                other_item.properties.path,
+                other_item.context,
+                publish_path,
+            )
+        return cache[id(item)][3]
+
+    def _get_plugin_items(self, settings, item):
+        """
+        Get the items of the publish tree with an active task run by the plugin
+        running the task of the given item and settings.
+
+        :param settings: This plugin instance's configured settings
+        :param item: The item being processed
+
+        :return: A list of items, starting with the given item.
+        """
+        plugin = None
+        for task in item.tasks:
+            if task.settings is settings:
+                plugin = task.plugin
+                break
+
+        root = item
+        while root.parent and not root.is_root:
+            root = root.parent
+
+        items = [item]
+        if plugin is None:
+            return items
+        for other_item in root.descendants:
+            if other_item is item or other_item.get_property("publish_path"):
+                continue
+            if any(task.plugin is plugin and task.active for task in other_item.tasks):
+                items.append(other_item)
+        return items
+
+    def get_publish_paths(self, settings, items):
+        """
+        Get the publish paths for the supplied settings and items.
+
+        Items are grouped by context, work template and publish template, so the
+        context fields and the templates matching the paths are only resolved once
+        for each group instead of once for each item.
+
+        :param settings: This plugin instance's configured settings
+        :param items: The items to determine the publish paths for
+
+        :return: A list of strings representing the output paths to supply when
+            registering a publish for the supplied items, in the items order.
+        """
+        publish_paths = [None] * len(items)
+        contexts = []
+        groups = {}
+        for index, item in enumerate(items):
+            # publish type explicitly set or defined on the item
+            publish_path = item.get_property("publish_path")
+            if publish_path:
+                publish_paths[index] = publish_path
+                continue
+
+            # contexts are compared by value, they may not be hashable
+            for context_index, context in enumerate(contexts):
+                if context == item.context:
+                    break
+            else:
+                context_index = len(contexts)
+                contexts.append(item.context)
+
+            work_template = item.properties.get("work_template")
+            publish_template = self.get_publish_template(settings, item)
+            groups.setdefault((context_index, work_template, publish_template), []).append(
+                index
+            )
+
+        for (_, work_template, publish_template), indexes in groups.items():
+            group_paths = self._resolve_publish_paths(
+                settings, [items[index] for index in indexes], work_template, publish_template
+            )
+            for index, publish_path in zip(indexes, group_paths):
+                publish_paths[index] = publish_path
+
+        return publish_paths
+
+    def _resolve_publish_paths(self, settings, items, work_template, publish_template):
+        """
+        Resolve the publish paths for items sharing the same context, work template
+        and publish template.
+
+        :param settings: This plugin instance's configured settings
+        :param items: The items to determine the publish paths for
+        :param work_template: The work template of the items, if any
+        :param publish_template: The publish template of the items, if any
+
+        :return: A list of publish paths, in the items order.
+        """
+
         # fall back to template/path logic
         # We need to be able to resolve the Publish Template keys.
         # This can be done by two methods
@@ -152,16 +600,14 @@ class BasicFilePublishPlugin(HookBaseClass):
         #    template keys as possible, and the provide the ones that can't
         #    be derived from context alone, such as the name or the version.
 
-        path = item.properties.path
-
-        work_template = item.properties.get("work_template")
-        publish_template = self.get_publish_template(settings, item)
+        paths = [item.properties.path for item in items]
 
-        self.logger.debug("publish_template: %s" % publish_template)
-        self.logger.debug("work_template: %s" % work_template)
+        self.logger.debug(
+            "Resolving %d publish paths with publish_template: %s, work_template: %s"
+            % (len(items), publish_template, work_template)
+        )
 
-        fields = []
-        publish_path = None
+        fields_list = [{} for _ in items]
 
         # See if we have a Publish template and optionally a
         # work template and gather the field data so we can use Toolkit
@@ -169,19 +615,27 @@ class BasicFilePublishPlugin(HookBaseClass):
         if work_template and publish_template:
             # We have a work template so we can try and get
             # the fields from the path using that.
-            if work_template.validate(path):
-                fields = work_template.get_fields(path)
+            for index, path in enumerate(paths):
+                if work_template.validate(path):
+                    fields_list[index] = work_template.get_fields(path)
         elif publish_template:
             # There is no work template provided, check to see if
             # we can match a template from the path.
-            work_template = self.sgtk.template_from_path(path)
-            if work_template:
-                fields = work_template.get_fields(path)
-            else:
+            path_templates = self._templates_from_paths(paths)
+            context_fields = None
+            for index, (item, path) in enumerate(zip(items, paths)):
+                path_template = path_templates[path]
+                if path_template:
+                    fields_list[index] = path_template.get_fields(path)
+                    continue
+
                 # No template could be found from the path, so it is likely this
                 # source file lives out side of the Toolkit structure currently.
-                # We need to try and resolve the template path using the context.
-                fields = item.context.as_template_fields(publish_template)
+                # We need to try and resolve the template path using the context,
+                # which is the same for all the items.
+                if context_fields is None:
+                    context_fields = item.context.as_template_fields(publish_template)
+                fields = dict(context_fields)
 
                 # Perform a check for common keys that can't be resolved from the context
                 # and try to provide values.
@@ -197,31 +651,34 @@ class BasicFilePublishPlugin(HookBaseClass):
                 if "extension" in publish_template.keys:
                     path_info = self.parent.util.get_file_path_components(path)
                     fields["extension"] = path_info["extension"]
-
-        self.logger.debug("publish_template: %s" % publish_template)
-        self.logger.debug("work_template: %s" % work_template)
-
-        # Now if we have a publish template we can use the fields
-        # to try and resolve the path.
-        if publish_template:
-            missing_keys = publish_template.missing_keys(fields)
-
-            if missing_keys:
-                self.logger.warning(
-                    "Not enough keys to apply work fields (%s) to "
-                    "publish template (%s)" % (fields, publish_template)
-                )
-            else:
-                publish_path = publish_template.apply_fields(fields)
+                fields_list[index] = fields
+
+        publish_paths = []
+        for path, fields in zip(paths, fields_list):
+            publish_path = None
+
+            # Now if we have a publish template we can use the fields
+            # to try and resolve the path.
+            if publish_template:
+                missing_keys = publish_template.missing_keys(fields)
+
+                if missing_keys:
+                    self.logger.warning(
+                        "Not enough keys to apply work fields (%s) to "
+                        "publish template (%s)" % (fields, publish_template)
+                    )
+                else:
+                    publish_path = publish_template.apply_fields(fields)
+                    self.logger.debug(
+                        "Used publish template to determine the publish path: %s"
+                        % (publish_path,)
+                    )
+
+            if not publish_path:
+                publish_path = path
                 self.logger.debug(
-                    "Used publish template to determine the publish path: %s"
-                    % (publish_path,)
+                    "Could not validate a publish template. Publishing in place."
                 )
+            publish_paths.append(publish_path)
 
-        if not publish_path:
-            publish_path = path
-            self.logger.debug(
-                "Could not validate a publish template. Publishing in place."
-            )
-
-        return publish_path
+        return publish_paths